@@ -0,0 +1,162 @@
+import struct
+import threading
+import time
+
+import network_3
+
+## pcapng block types and options
+SHB_TYPE = 0x0A0D0D0A
+IDB_TYPE = 1
+EPB_TYPE = 6
+BYTE_ORDER_MAGIC = 0x1A2B3C4D
+OPT_ENDOFOPT = 0
+IF_NAME = 2
+IF_TSRESOL = 9
+EPB_FLAGS = 2
+## link type for our packet header, from the range reserved for private use (LINKTYPE_USER0)
+LINKTYPE_NETWORK_3 = 147
+## epb_flags direction bits
+INBOUND = 1
+OUTBOUND = 2
+
+
+## a pcapng option, padded to 32 bits
+def option(code, value_B):
+    return struct.pack('<HH', code, len(value_B)) + value_B + b'\0' * (-len(value_B) % 4)
+
+
+## a pcapng block with its type and the total length before and after the body
+def block(block_type, body_B):
+    length = len(body_B) + 12
+    return struct.pack('<II', block_type, length) + body_B + struct.pack('<I', length)
+
+
+## Captures packets put into interface queues and writes them to a pcapng file
+# with nanosecond timestamps. The capture hooks only filter and append the
+# packet to a buffer, formatting and writing is left to a background writer
+# thread (run), so the simulation does not pay for it.
+class PacketCapture:
+
+    ## @param path_S - pcapng file to write
+    # @param prot_S - protocols to capture, e.g. '1' for data or '2' for control, None for all
+    # @param dst_S - destination host names or addresses to capture, None for all
+    # @param flush_interval - seconds between writes of the buffered packets
+    def __init__(self, path_S, prot_S=None, dst_S=None, flush_interval=0.05):
+        self.prot_S = set(prot_S) if prot_S is not None else None
+        #addresses are matched as they are encoded in the packet header
+        self.dst_S = {str(network_3.addr_to_int(dst)) if '.' in dst else dst for dst in dst_S} if dst_S is not None else None
+        self.flush_interval = flush_interval
+        self.buf_L = []      # (ns, capture interface id, direction, packet) waiting to be written
+        self.idb_L = []      # interface description blocks not written yet
+        self.if_count = 0
+        self.hooked_L = []   # (interface, put method it replaced)
+        self.lock = threading.Lock() #serializes writes to the file
+        self.f = open(path_S, 'wb')
+        self.f.write(block(SHB_TYPE, struct.pack('<IHHq', BYTE_ORDER_MAGIC, 1, 0, -1) + option(OPT_ENDOFOPT, b'')))
+        self.stop = False #for thread termination
+
+    ## called when printing the object
+    def __str__(self):
+        return 'PacketCapture'
+
+    ## describe a capture point as a pcapng interface
+    # @return the interface id referenced by its packets
+    def add_interface(self, name_S):
+        self.idb_L.append(block(IDB_TYPE, struct.pack('<HHI', LINKTYPE_NETWORK_3, 0, 0) + option(IF_NAME, name_S.encode())
+                                + option(IF_TSRESOL, b'\x09') + option(OPT_ENDOFOPT, b'')))
+        self.if_count += 1
+        return self.if_count - 1
+
+    ## capture the packets put into the queues of one interface
+    # @param node: host or router
+    # @param i: number of the interface on the node
+    # @param in_or_out: 'in', 'out' or None for both directions
+    # @param name_S: name of the capture point, defaults to node-interface
+    def attach_interface(self, node, i, in_or_out=None, name_S=None):
+        if_id = self.add_interface(name_S or '%s-%d' % (node, i))
+        intf = node.intf_L[i]
+        put = intf.put
+        buf_L, prot_S, dst_S, clock = self.buf_L, self.prot_S, self.dst_S, time.time_ns
+        peek_prot, peek_dst = network_3.NetworkPacket.peek_prot, network_3.NetworkPacket.peek_dst
+        def captured_put(pkt_S, direction_S, block=False):
+            put(pkt_S, direction_S, block)
+            if in_or_out is not None and direction_S != in_or_out:
+                return
+            if prot_S is not None and peek_prot(pkt_S) not in prot_S:
+                return
+            if dst_S is not None and peek_dst(pkt_S) not in dst_S:
+                return
+            buf_L.append((clock(), if_id, INBOUND if direction_S == 'in' else OUTBOUND, pkt_S))
+        intf.put = captured_put
+        self.hooked_L.append((intf, put))
+
+    ## capture the packets a link delivers, in both directions
+    # @param link: Link or SocketLink
+    def attach_link(self, link):
+        for (node, i) in link.endpoints():
+            self.attach_interface(node, i, 'in', '%s -> %s-%d' % (link, node, i))
+
+    ## format and write the buffered packets
+    def flush(self):
+        with self.lock:
+            n = len(self.buf_L)
+            buf_L = self.buf_L[:n]
+            del self.buf_L[:n] #hooks may append meanwhile
+            idb_L, self.idb_L = self.idb_L, []
+            out_L = idb_L
+            for (ns, if_id, direction, pkt_S) in buf_L:
+                data_B = pkt_S.encode()
+                out_L.append(block(EPB_TYPE, struct.pack('<IIIII', if_id, ns >> 32, ns & 0xFFFFFFFF, len(data_B), len(data_B))
+                                   + data_B + b'\0' * (-len(data_B) % 4)
+                                   + option(EPB_FLAGS, struct.pack('<I', direction)) + option(OPT_ENDOFOPT, b'')))
+            self.f.write(b''.join(out_L))
+
+    ## stop capturing, write what is left and close the file
+    def close(self):
+        for (intf, put) in reversed(self.hooked_L):
+            intf.put = put
+        self.hooked_L = []
+        self.flush()
+        self.f.close()
+
+    ## thread target for the background writer
+    def run(self):
+        print (threading.currentThread().getName() + ': Starting')
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            if self.stop:
+                print (threading.currentThread().getName() + ': Ending')
+                return
+
+
+## read the packets of a pcapng file written by PacketCapture
+# @param path_S: pcapng file
+# @return list of (ns since the epoch, capture point name, 'in' or 'out', packet string)
+def read_packets(path_S):
+    with open(path_S, 'rb') as f:
+        data_B = f.read()
+    name_L = []
+    pkt_L = []
+    pos = 0
+    while pos + 12 <= len(data_B):
+        block_type, length = struct.unpack_from('<II', data_B, pos)
+        if block_type == IDB_TYPE:
+            opt_pos = pos + 16
+            name_S = ''
+            while True:
+                code, opt_length = struct.unpack_from('<HH', data_B, opt_pos)
+                if code == OPT_ENDOFOPT:
+                    break
+                if code == IF_NAME:
+                    name_S = data_B[opt_pos + 4 : opt_pos + 4 + opt_length].decode()
+                opt_pos += 4 + opt_length + (-opt_length % 4)
+            name_L.append(name_S)
+        elif block_type == EPB_TYPE:
+            if_id, ts_high, ts_low, cap_length, _ = struct.unpack_from('<IIIII', data_B, pos + 8)
+            pkt_S = data_B[pos + 28 : pos + 28 + cap_length].decode()
+            flags_pos = pos + 28 + cap_length + (-cap_length % 4)
+            (direction,) = struct.unpack_from('<I', data_B, flags_pos + 4)
+            pkt_L.append(((ts_high << 32) | ts_low, name_L[if_id], 'in' if direction == INBOUND else 'out', pkt_S))
+        pos += length
+    return pkt_L
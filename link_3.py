@@ -1,5 +1,11 @@
+import os
 import queue
+import selectors
+import socket
 import threading
+import time
+
+import network_3
 
 ## An abstraction of a link between router interfaces
 class Link:
@@ -14,6 +20,8 @@ class Link:
         self.node_1_intf = node_1_intf
         self.node_2 = node_2
         self.node_2_intf = node_2_intf
+        self.up = True #packets offered to a failed link are lost
+        self.ctrl_pkt_count = 0 #number of control packets carried by the link
         print('Created link %s' % self.__str__())
         
     ## called when printing the object
@@ -21,7 +29,9 @@ class Link:
         return 'Link %s-%d - %s-%d' % (self.node_1, self.node_1_intf, self.node_2, self.node_2_intf)
         
     ##transmit a packet between interfaces in each direction
+    # @return number of packets taken off the interfaces, 0 when the link was idle
     def tx_pkt(self):
+        count = 0
         for (node_a, node_a_intf, node_b, node_b_intf) in \
         [(self.node_1, self.node_1_intf, self.node_2, self.node_2_intf), 
          (self.node_2, self.node_2_intf, self.node_1, self.node_1_intf)]: 
@@ -30,15 +40,170 @@ class Link:
             pkt_S = intf_a.get('out')
             if pkt_S is None:
                 continue #continue if no packet to transfer
+            count += 1
+            if not self.up:
+                print('%s: direction %s-%s -> %s-%s: link down, packet lost' % \
+                    (self, node_a, node_a_intf, node_b, node_b_intf))
+                continue
             #otherwise transmit the packet
             try:
                 intf_b.put(pkt_S, 'in')
+                if network_3.NetworkPacket.peek_prot(pkt_S) == '2':
+                    self.ctrl_pkt_count += 1
                 print('%s: direction %s-%s -> %s-%s: transmitting packet "%s"' % \
                     (self, node_a, node_a_intf, node_b, node_b_intf, pkt_S))
             except queue.Full:
                 print('%s: direction %s-%s -> %s-%s: packet lost' % \
                     (self, node_a, node_a_intf, node_b, node_b_intf))
                 pass
+        return count
+                
+    ## one non-blocking step of the link, for schedulers that run links without their own threads
+    # @return number of packets taken off the interfaces, 0 when the link was idle
+    def step(self):
+        return self.tx_pkt()
+                
+    ## endpoints of the link as (node, interface) pairs
+    def endpoints(self):
+        return [(self.node_1, self.node_1_intf), (self.node_2, self.node_2_intf)]
+                
+    ## change the cost of the link and notify both endpoint routers
+    # @param cost: new cost of the link in both directions
+    def set_cost(self, cost):
+        for (node, intf) in self.endpoints():
+            if hasattr(node, 'set_link_cost'): #hosts do not run routing
+                node.set_link_cost(intf, cost)
+                
+    ## fail the link and notify both endpoint routers
+    def fail(self):
+        self.up = False
+        print('%s: link failed' % self)
+        for (node, intf) in self.endpoints():
+            if hasattr(node, 'link_down'):
+                node.link_down(intf)
+                
+    ## restore a failed link and notify both endpoint routers
+    def restore(self):
+        self.up = True
+        print('%s: link restored' % self)
+        for (node, intf) in self.endpoints():
+            if hasattr(node, 'link_up'):
+                node.link_up(intf)
+        
+        
+## One end of a link whose other end runs in another process, possibly on
+# another machine. Packets are carried as datagrams over a UDP socket, or a
+# Unix datagram socket when the addresses are paths. The other process runs
+# a SocketLink with the two addresses swapped.
+class SocketLink:
+    
+    ## largest packet that fits into one datagram
+    max_datagram = 65507
+    
+    ## @param node: local node
+    # @param node_intf: number of the interface on that node
+    # @param local_addr: (host, port) of our UDP socket, or the path of our Unix datagram socket
+    # @param remote_addr: address of the socket of the other end
+    # @param batch: packets moved in each direction per call
+    def __init__(self, node, node_intf, local_addr, remote_addr, batch=64):
+        self.node = node
+        self.node_intf = node_intf
+        self.local_addr = local_addr
+        self.remote_addr = remote_addr
+        self.batch = batch
+        family = socket.AF_UNIX if isinstance(local_addr, str) else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        if family == socket.AF_UNIX and os.path.exists(local_addr):
+            os.unlink(local_addr) #left over from an earlier run
+        self.sock.bind(local_addr)
+        self.sock.setblocking(False)
+        self.up = True #packets offered to a failed link are lost
+        self.ctrl_pkt_count = 0 #number of control packets received over the link
+        print('Created link %s' % self.__str__())
+        
+    ## called when printing the object
+    def __str__(self):
+        return 'SocketLink %s-%d - %s' % (self.node, self.node_intf, self.remote_addr)
+    
+    ## send a batch of packets from the out queue of our interface to the other end
+    # @return number of packets taken off the interface, 0 when the link was idle
+    def tx_pkt(self):
+        intf = self.node.intf_L[self.node_intf]
+        count = 0
+        while count < self.batch:
+            pkt_S = intf.get('out')
+            if pkt_S is None:
+                break
+            count += 1
+            data_B = pkt_S.encode()
+            if not self.up or len(data_B) > self.max_datagram:
+                print('%s: packet "%s" lost' % (self, pkt_S))
+                continue
+            try:
+                self.sock.sendto(data_B, self.remote_addr)
+            except OSError: #socket buffer full or the other end not listening yet
+                print('%s: packet "%s" lost' % (self, pkt_S))
+        return count
+    
+    ## put a batch of packets received from the other end into the in queue of our interface
+    # @return number of packets received, 0 when there were none
+    def rx_pkt(self):
+        intf = self.node.intf_L[self.node_intf]
+        count = 0
+        while count < self.batch:
+            try:
+                data_B = self.sock.recv(self.max_datagram)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionRefusedError: #reported for an earlier send before the other end was listening
+                continue
+            count += 1
+            if not self.up:
+                continue
+            pkt_S = data_B.decode()
+            try:
+                intf.put(pkt_S, 'in')
+                if network_3.NetworkPacket.peek_prot(pkt_S) == '2':
+                    self.ctrl_pkt_count += 1
+                print('%s: received packet "%s"' % (self, pkt_S))
+            except queue.Full:
+                print('%s: packet "%s" lost' % (self, pkt_S))
+        return count
+    
+    ## one non-blocking step of the link, sending only. Datagrams are received
+    # when the selector of the link layer finds them waiting (LinkLayer.receive)
+    def step(self):
+        return self.tx_pkt()
+    
+    ## the local endpoint of the link as a (node, interface) pair
+    def endpoints(self):
+        return [(self.node, self.node_intf)]
+    
+    ## change the cost of the link at our end, the other process changes its own end
+    # @param cost: new cost of the link
+    def set_cost(self, cost):
+        if hasattr(self.node, 'set_link_cost'):
+            self.node.set_link_cost(self.node_intf, cost)
+            
+    ## fail our end of the link
+    def fail(self):
+        self.up = False
+        print('%s: link failed' % self)
+        if hasattr(self.node, 'link_down'):
+            self.node.link_down(self.node_intf)
+            
+    ## restore our end of the link
+    def restore(self):
+        self.up = True
+        print('%s: link restored' % self)
+        if hasattr(self.node, 'link_up'):
+            self.node.link_up(self.node_intf)
+            
+    ## close the socket
+    def close(self):
+        self.sock.close()
+        if isinstance(self.local_addr, str) and os.path.exists(self.local_addr):
+            os.unlink(self.local_addr)
         
         
 ## An abstraction of the link layer
@@ -48,6 +213,16 @@ class LinkLayer:
         ## list of links in the network
         self.link_L = []
         self.stop = False #for thread termination
+        ## one selector over the sockets of all SocketLinks, so idle sockets cost no system calls
+        self.selector = selectors.DefaultSelector()
+        self.socket_link_count = 0
+        ## only receive on the sockets in run(), set when a scheduler steps the links
+        self.receive_only = False
+        ## topology events and how long routing took to recover from them
+        self.event_L = []
+        ## clock and sleep, replaced by virtual time when run deterministically
+        self.clock = time.monotonic
+        self.sleep = time.sleep
         
     ## called when printing the object
     def __str__(self):
@@ -56,18 +231,93 @@ class LinkLayer:
     ##add a Link to the network
     def add_link(self, link):
         self.link_L.append(link)
+        if hasattr(link, 'sock'):
+            self.selector.register(link.sock, selectors.EVENT_READ, link)
+            self.socket_link_count += 1
+        
+    ## total number of control packets carried by all links
+    def ctrl_pkt_count(self):
+        return sum(link.ctrl_pkt_count for link in self.link_L)
+        
+    ## total number of control packets the routers on our links sent for
+    # route or link changes, leaving out periodic refreshes of unchanged routes
+    def change_pkt_count(self):
+        node_S = {node for link in self.link_L for (node, _) in link.endpoints() if hasattr(node, 'change_sent_count')}
+        return sum(node.change_sent_count for node in node_S)
+        
+    ## record a topology event so its reconvergence can be measured
+    # @param event_S: description of the event
+    def record_event(self, event_S):
+        self.event_L.append({'event': event_S, 'time': self.clock(), 'ctrl_start': self.change_pkt_count()})
+        
+    ##change the cost of a link while the simulation runs
+    def change_link_cost(self, link, cost):
+        self.record_event('%s cost %d' % (link, cost))
+        link.set_cost(cost)
+        
+    ##fail a link while the simulation runs
+    def fail_link(self, link):
+        self.record_event('%s failed' % link)
+        link.fail()
+        
+    ##restore a failed link while the simulation runs
+    def restore_link(self, link):
+        self.record_event('%s restored' % link)
+        link.restore()
+        
+    ## wait for the routes to settle after the last topology event and record
+    # the time to reconverge and the control packets sent for changes meanwhile.
+    # Periodic refreshes go on regardless, so they neither count nor keep the wait going.
+    # @param router_L: routers whose tables must settle
+    # @param quiet_time: seconds without route changes or pending triggered
+    #  updates after which routing is converged
+    # @param timeout: give up waiting after this many seconds
+    def measure_reconvergence(self, router_L, quiet_time=0.5, timeout=30):
+        event_D = self.event_L[-1]
+        quiet_since = self.clock()
+        while True:
+            last_change = max([router.last_change_time for router in router_L] + [event_D['time']])
+            if any(router.pending_S for router in router_L):
+                quiet_since = self.clock()
+            if self.clock() - max(last_change, quiet_since) >= quiet_time:
+                break
+            if self.clock() - event_D['time'] > timeout:
+                print('%s: routing did not reconverge within %d seconds' % (self, timeout))
+                break
+            self.sleep(0.01)
+        last_change = max(router.last_change_time for router in router_L)
+        event_D['reconverge_time'] = max(last_change - event_D['time'], 0)
+        event_D['ctrl_pkts'] = self.change_pkt_count() - event_D['ctrl_start']
+        print('%s: %s: reconverged in %.3f s using %d control packets' % \
+            (self, event_D['event'], event_D['reconverge_time'], event_D['ctrl_pkts']))
+        return event_D
         
     ##transfer a packet across all links
     def transfer(self):
         for link in self.link_L:
             link.tx_pkt()
+        if self.socket_link_count:
+            self.receive()
+            
+    ## receive on the sockets that have datagrams waiting
+    # @param timeout: seconds to wait for a datagram, 0 to not wait
+    # @return number of packets received
+    def receive(self, timeout=0):
+        count = 0
+        for (key, _) in self.selector.select(timeout):
+            count += key.data.rx_pkt()
+        return count
                 
     ## thread target for the network to keep transmitting data across links
     def run(self):
         print (threading.currentThread().getName() + ': Starting')
         while True:
-            #transfer one packet on all the links
-            self.transfer()
+            if self.receive_only:
+                #a scheduler sends, we wait for datagrams arriving from outside
+                self.receive(0.1)
+            else:
+                #transfer one packet on all the links
+                self.transfer()
             #terminate
             if self.stop:
                 print (threading.currentThread().getName() + ': Ending')
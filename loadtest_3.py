@@ -0,0 +1,250 @@
+import random
+import time
+
+import network_3
+import trace_3
+
+
+## Traffic matrices give the share of the offered load sent from each host
+# to each other host as {(source host, destination host): share}, shares sum to 1.
+
+## every host sends to every other host equally
+# @param host_L: hosts of the topology
+def all_to_all(host_L):
+    pair_L = [(src, dst) for src in host_L for dst in host_L if src is not dst]
+    return {pair: 1 / len(pair_L) for pair in pair_L}
+
+
+## every host sends a fraction of its traffic to one hot host and spreads the rest over the others
+# @param host_L: hosts of the topology
+# @param hot: host receiving the extra traffic, the first host by default
+# @param fraction: share of each host's traffic sent to the hot host
+def hotspot(host_L, hot=None, fraction=0.5):
+    hot = hot if hot is not None else host_L[0]
+    share = 1 / len(host_L)
+    matrix_D = {}
+    for src in host_L:
+        dst_L = [dst for dst in host_L if dst is not src and dst is not hot]
+        if src is not hot and dst_L:
+            matrix_D[(src, hot)] = share * fraction
+            for dst in dst_L:
+                matrix_D[(src, dst)] = share * (1 - fraction) / len(dst_L)
+        else:
+            dst_L = [dst for dst in host_L if dst is not src]
+            for dst in dst_L:
+                matrix_D[(src, dst)] = share / len(dst_L)
+    return matrix_D
+
+
+## traffic between two hosts proportional to the product of their masses
+# @param host_L: hosts of the topology
+# @param mass_D: {host name: mass}, hosts not listed have mass 1
+def gravity(host_L, mass_D=None):
+    mass_D = mass_D or {}
+    weight_D = {(src, dst): mass_D.get(str(src), 1) * mass_D.get(str(dst), 1)
+                for src in host_L for dst in host_L if src is not dst}
+    total = sum(weight_D.values())
+    return {pair: weight / total for pair, weight in weight_D.items()}
+
+
+## traffic matrices by name
+matrix_D = {'all-to-all': all_to_all, 'hotspot': hotspot, 'gravity': gravity}
+
+
+## goodput, loss and latency percentiles of a set of packets
+# @param sent: packets sent
+# @param latency_L: latencies of the packets received, in seconds
+# @param byte_count: payload bytes received
+# @param duration: seconds over which the packets were sent
+def stats(sent, latency_L, byte_count, duration):
+    latency_L = sorted(latency_L)
+    stat_D = {'sent': sent, 'received': len(latency_L),
+              'loss': 1 - len(latency_L) / sent if sent else 0.0,
+              'goodput': len(latency_L) / duration, 'goodput_bytes': byte_count / duration}
+    for name_S, pct in [('p50', 50), ('p99', 99), ('p999', 99.9)]:
+        stat_D[name_S] = trace_3.percentile(latency_L, pct) if latency_L else None
+    return stat_D
+
+
+## Drives the hosts of a topology with the traffic of a traffic matrix at
+# increasing offered loads, and measures goodput, loss and end-to-end latency
+# per host pair and per load step. Packets carry a sequence number, their send
+# time is kept by the load test, and host receives are hooked like the
+# profiling hooks to timestamp arrivals.
+class LoadTest:
+
+    ## payloads of load test packets start with this
+    prefix_S = 'LT:'
+
+    ## @param matrix_D - traffic matrix {(source host, destination host): share}
+    # @param pkt_size - bytes of each packet including the header
+    # @param pace_interval - seconds between bursts of sends, the packets due in each interval go out together
+    # @param drain_time - seconds to wait after a step for packets in flight, later arrivals count as lost
+    # @param seed - seed of the choice of host pair for each packet
+    # @param max_loss - loss above which the network is saturated
+    # @param latency_factor - p99 latency above this multiple of that at the lowest load is saturated too,
+    #  latencies below one pace interval are not told apart
+    def __init__(self, matrix_D, pkt_size=64, pace_interval=0.01, drain_time=1.0, seed=0, max_loss=0.01, latency_factor=10):
+        self.pair_L = list(matrix_D)
+        self.weight_L = [matrix_D[pair] for pair in self.pair_L]
+        self.pkt_size = pkt_size
+        self.pace_interval = pace_interval
+        self.drain_time = drain_time
+        self.rng = random.Random(seed)
+        self.max_loss = max_loss
+        self.latency_factor = latency_factor
+        self.seq = 0
+        self.sent_D = {}  # {sequence number: (source name, destination name, send time)}
+        self.recv_L = []  # (packet, receive time) not yet summarized
+        ## clock and sleep, replaced by virtual time when run deterministically
+        self.clock = time.monotonic
+        self.sleep = time.sleep
+        self.hooked_L = []
+        for host in {host for pair in self.pair_L for host in pair}:
+            self.hook(host)
+
+    ## timestamp the load test packets a host receives
+    def hook(self, host):
+        func = host.udt_receive
+        recv_L, prefix_S = self.recv_L, self.prefix_S
+        start = network_3.NetworkPacket.dst_S_length + network_3.NetworkPacket.prot_S_length + network_3.NetworkPacket.src_S_length
+        def received():
+            pkt_S = func()
+            if pkt_S is not None and pkt_S.startswith(prefix_S, start):
+                recv_L.append((pkt_S, self.clock()))
+            return pkt_S
+        host.udt_receive = received
+        self.hooked_L.append(host)
+
+    ## stop timestamping arrivals
+    def close(self):
+        for host in self.hooked_L:
+            del host.udt_receive
+        self.hooked_L = []
+
+    ## send one load test packet
+    def send(self, src, dst):
+        data_S = '%s%d:' % (self.prefix_S, self.seq)
+        data_S += '.' * max(0, self.pkt_size - network_3.NetworkPacket.dst_S_length - network_3.NetworkPacket.prot_S_length
+                              - network_3.NetworkPacket.src_S_length - len(data_S))
+        self.sent_D[self.seq] = (str(src), str(dst), self.clock())
+        self.seq += 1
+        src.udt_send(str(dst), data_S)
+
+    ## offer one load and measure what arrived
+    # @param rate: offered load in packets per second over all host pairs
+    # @param duration: seconds to send for
+    # @return stats of the step, with 'rate' and 'pair_D' {(source, destination): stats}
+    def run_step(self, rate, duration):
+        print('Load test: offering %.1f packets/s for %.1f s' % (rate, duration))
+        first_seq = self.seq
+        count = int(rate * duration)
+        sent = 0
+        start = self.clock()
+        while sent < count:
+            due = min(count, int((self.clock() - start) * rate) + 1)
+            for (src, dst) in self.rng.choices(self.pair_L, self.weight_L, k=due - sent):
+                self.send(src, dst)
+            sent = due
+            self.sleep(self.pace_interval)
+        self.sleep(self.drain_time)
+        return self.summarize(rate, duration, first_seq, self.seq)
+
+    ## stats of the packets of one step, overall and per host pair
+    # @param first_seq, end_seq: sequence numbers sent in the step
+    def summarize(self, rate, duration, first_seq, end_seq):
+        n = len(self.recv_L)
+        recv_L = self.recv_L[:n]
+        del self.recv_L[:n] #hooks may append meanwhile
+        pair_D = {} # {(source, destination): [sent, latencies, bytes received]}
+        for seq in range(first_seq, end_seq):
+            pair_D.setdefault(self.sent_D[seq][:2], [0, [], 0])[0] += 1
+        start = network_3.NetworkPacket.dst_S_length + network_3.NetworkPacket.prot_S_length + network_3.NetworkPacket.src_S_length
+        for (pkt_S, recv_time) in recv_L:
+            seq = int(pkt_S[start + len(self.prefix_S) :].split(':', 1)[0])
+            if first_seq <= seq < end_seq: #earlier steps' stragglers are already counted as lost
+                src, dst, send_time = self.sent_D[seq]
+                pair_D[(src, dst)][1].append(recv_time - send_time)
+                pair_D[(src, dst)][2] += len(pkt_S) - start
+        for seq in range(first_seq, end_seq):
+            del self.sent_D[seq]
+        step_D = stats(end_seq - first_seq, [lat for (_, lat_L, _) in pair_D.values() for lat in lat_L],
+                       sum(byte_count for (_, _, byte_count) in pair_D.values()), duration)
+        step_D['rate'] = rate
+        step_D['pair_D'] = {pair: stats(sent, lat_L, byte_count, duration) for pair, (sent, lat_L, byte_count) in sorted(pair_D.items())}
+        return step_D
+
+    ## offer each load in turn
+    # @param rate_L: offered loads in packets per second
+    # @param duration: seconds to send for at each load
+    # @return stats of each step
+    def run(self, rate_L, duration=2.0):
+        return [self.run_step(rate, duration) for rate in rate_L]
+
+    ## whether a step saturated the network: it lost too many packets, or its
+    # p99 latency grew too far beyond that of the baseline step at the lowest load
+    def saturated(self, step_D, base_D):
+        if step_D['loss'] > self.max_loss:
+            return True
+        if step_D['p99'] is None or base_D['p99'] is None:
+            return False
+        return step_D['p99'] > self.latency_factor * max(base_D['p99'], self.pace_interval)
+
+    ## search for the saturation knee: double the offered load until the
+    # network saturates, then bisect between the last load it carried and
+    # the first it did not
+    # @param rate: offered load of the first step in packets per second
+    # @param duration: seconds to send for at each load
+    # @param max_steps: give up doubling after this many steps
+    # @param refine_steps: bisection steps once saturation is found
+    # @return stats of each step, in the order they ran
+    def find_knee(self, rate=25.0, duration=2.0, max_steps=8, refine_steps=2):
+        step_L = [self.run_step(rate, duration)]
+        while not self.saturated(step_L[-1], step_L[0]) and len(step_L) < max_steps:
+            step_L.append(self.run_step(step_L[-1]['rate'] * 2, duration))
+        if len(step_L) > 1 and self.saturated(step_L[-1], step_L[0]):
+            good, bad = step_L[-2]['rate'], step_L[-1]['rate']
+            for _ in range(refine_steps):
+                step_L.append(self.run_step((good + bad) / 2, duration))
+                if self.saturated(step_L[-1], step_L[0]):
+                    bad = step_L[-1]['rate']
+                else:
+                    good = step_L[-1]['rate']
+        return step_L
+
+    ## the saturation knee of a set of steps
+    # @return the highest load carried without saturating and the lowest load that saturated, None if there was none
+    def knee(self, step_L):
+        step_L = sorted(step_L, key=lambda step_D: step_D['rate'])
+        good = bad = None
+        for step_D in step_L:
+            if self.saturated(step_D, step_L[0]):
+                if bad is None:
+                    bad = step_D['rate']
+            elif bad is None:
+                good = step_D['rate']
+        return good, bad
+
+    ## report of the steps as a table per offered load with a row per host pair, and the knee
+    # @param step_L: stats of the steps
+    def report(self, step_L):
+        def ms(value):
+            return '%.2f' % (value * 1000) if value is not None else '-'
+        def row(name_S, stat_D):
+            return '  %-10s %6d %6d %6.1f%% %9.1f %10.0f %8s %8s %8s' % (name_S, stat_D['sent'], stat_D['received'], stat_D['loss'] * 100,
+                stat_D['goodput'], stat_D['goodput_bytes'], ms(stat_D['p50']), ms(stat_D['p99']), ms(stat_D['p999']))
+        line_L = []
+        for step_D in sorted(step_L, key=lambda step_D: step_D['rate']):
+            line_L.append('Offered load %.1f packets/s' % step_D['rate'])
+            line_L.append('  %-10s %6s %6s %7s %9s %10s %8s %8s %8s' % ('pair', 'sent', 'recv', 'loss', 'pkts/s', 'bytes/s', 'p50 ms', 'p99 ms', 'p999 ms'))
+            for (src, dst), stat_D in step_D['pair_D'].items():
+                line_L.append(row('%s->%s' % (src, dst), stat_D))
+            line_L.append(row('all', step_D))
+        good, bad = self.knee(step_L)
+        if bad is None:
+            line_L.append('No saturation up to %.1f packets/s' % max(step_D['rate'] for step_D in step_L))
+        elif good is None:
+            line_L.append('Saturated already at %.1f packets/s' % bad)
+        else:
+            line_L.append('Saturation knee between %.1f and %.1f packets/s' % (good, bad))
+        return '\n'.join(line_L)
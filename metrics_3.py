@@ -0,0 +1,106 @@
+import http.server
+import threading
+
+
+## escape a label value of the Prometheus text format
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+## Serves metrics of a running simulation on http://host:port/metrics in the
+# Prometheus text exposition format. Everything is read from the counters the
+# nodes and links keep anyway when the endpoint is scraped, so an unscraped
+# server costs the simulation nothing.
+class MetricsServer:
+
+    ## @param obj_L - simulation objects, as in the simulation's object list
+    # @param port - TCP port to listen on
+    # @param host - address to listen on, only localhost by default
+    # @param quiet_time - seconds without route changes after which a router counts as converged
+    def __init__(self, obj_L, port=9100, host='127.0.0.1', quiet_time=0.5):
+        self.node_L = [obj for obj in obj_L if hasattr(obj, 'intf_L')]
+        self.router_L = [obj for obj in self.node_L if hasattr(obj, 'forward_packet')]
+        self.link_layer_L = [obj for obj in obj_L if hasattr(obj, 'link_L')]
+        self.quiet_time = quiet_time
+        server = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body_B = server.collect().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body_B)))
+                self.end_headers()
+                self.wfile.write(body_B)
+            def log_message(self, *args):
+                pass #scrapes would drown the simulation output
+        self.httpd = http.server.HTTPServer((host, port), Handler)
+        self.httpd.timeout = 0.1 #check for termination between requests
+        self.stop = False #for thread termination
+
+    ## called when printing the object
+    def __str__(self):
+        return 'MetricsServer'
+
+    ## whether a router's routes are settled: no route change within quiet_time,
+    # no control packets waiting to be processed and no triggered update pending
+    def converged(self, router):
+        return router.clock() - router.last_change_time >= self.quiet_time and router.ctrl_Q.empty() and not router.pending_S
+
+    ## render all metrics
+    # @return the metrics page in the Prometheus text format
+    def collect(self):
+        line_L = []
+        def metric(name_S, type_S, help_S, sample_L):
+            line_L.append('# HELP %s %s' % (name_S, help_S))
+            line_L.append('# TYPE %s %s' % (name_S, type_S))
+            for (label_D, value) in sample_L:
+                label_S = ','.join('%s="%s"' % (key, label(val)) for key, val in label_D.items())
+                line_L.append('%s{%s} %s' % (name_S, label_S, value))
+        queue_L = [({'node': node, 'interface': i, 'direction': direction_S}, intf.in_queue if direction_S == 'in' else intf.out_queue)
+                   for node in self.node_L for i, intf in enumerate(node.intf_L) for direction_S in ('in', 'out')]
+        metric('network_queue_packets', 'gauge', 'Packets held by an interface queue.',
+               [(label_D, q.qsize()) for (label_D, q) in queue_L])
+        metric('network_queue_bytes', 'gauge', 'Bytes held by an interface queue.',
+               [(label_D, q.bytes) for (label_D, q) in queue_L])
+        metric('network_queue_packets_total', 'counter', 'Packets accepted by an interface queue.',
+               [(label_D, q.put_count) for (label_D, q) in queue_L])
+        metric('network_queue_dropped_total', 'counter', 'Packets dropped by an interface queue.',
+               [(label_D, q.drop_count) for (label_D, q) in queue_L])
+        metric('network_router_forwarded_total', 'counter', 'Packets forwarded by a router, multicast copies counted separately.',
+               [({'router': router}, router.forwarded_count()) for router in self.router_L])
+        metric('network_router_dropped_total', 'counter', 'Data packets a router dropped for lack of a route or multicast tree.',
+               [({'router': router}, router.no_route_count) for router in self.router_L])
+        metric('network_router_local_total', 'counter', 'Data packets addressed to a router itself.',
+               [({'router': router}, router.local_count) for router in self.router_L])
+        metric('network_router_control_sent_total', 'counter', 'Control packets sent by a router.',
+               [({'router': router}, router.ctrl_sent_count) for router in self.router_L])
+        metric('network_router_snapshot_version', 'gauge', 'Version of the routing snapshot a router forwards with.',
+               [({'router': router}, router.snapshot.version) for router in self.router_L])
+        metric('network_router_pending_updates', 'gauge', 'Destinations waiting for a triggered update.',
+               [({'router': router}, len(router.pending_S)) for router in self.router_L])
+        metric('network_router_seconds_since_change', 'gauge', 'Seconds since the routes of a router last changed.',
+               [({'router': router}, '%.3f' % (router.clock() - router.last_change_time)) for router in self.router_L])
+        converged_L = [self.converged(router) for router in self.router_L]
+        metric('network_router_converged', 'gauge', 'Whether the routes of a router are settled.',
+               [({'router': router}, int(conv)) for router, conv in zip(self.router_L, converged_L)])
+        line_L.append('# HELP network_converged Whether the routes of all routers are settled.')
+        line_L.append('# TYPE network_converged gauge')
+        line_L.append('network_converged %d' % all(converged_L))
+        link_L = [link for link_layer in self.link_layer_L for link in link_layer.link_L]
+        metric('network_link_up', 'gauge', 'Whether a link is up.',
+               [({'link': link}, int(link.up)) for link in link_L])
+        metric('network_link_control_packets_total', 'counter', 'Control packets carried by a link.',
+               [({'link': link}, link.ctrl_pkt_count) for link in link_L])
+        return '\n'.join(line_L) + '\n'
+
+    ## thread target for the server, answers scrapes until stopped
+    def run(self):
+        print (threading.currentThread().getName() + ': Starting')
+        print('%s: serving metrics on http://%s:%d/metrics' % (self, self.httpd.server_address[0], self.httpd.server_address[1]))
+        while not self.stop:
+            self.httpd.handle_request()
+        self.httpd.server_close()
+        print (threading.currentThread().getName() + ': Ending')
@@ -1,13 +1,164 @@
+import collections
+import heapq
 import queue
+import random
 import threading
+import time
+import zlib
 
+## default cost at which a destination is considered unreachable
+INFINITY = 100
+
+
+## A router-wide buffer shared by the queues of its interfaces, like the
+# shared packet memory of a switch. Each queue is guaranteed a reserve of
+# bytes of its own and takes any bytes beyond that from the shared part.
+class BufferPool:
+    
+    ## @param size - total bytes of the buffer
+    # @param reserve - bytes reserved for each queue drawing on the buffer
+    def __init__(self, size, reserve=0):
+        self.size = size
+        self.reserve = reserve
+        self.shared = size #bytes not reserved by any queue
+        self.shared_used = 0 #bytes taken from the shared part
+        self.lock = threading.Lock()
+        
+    ## reserve the minimum of a new queue
+    def register(self):
+        if self.shared < self.reserve:
+            raise Exception('Buffer pool of %d bytes cannot reserve %d bytes for another queue' % (self.size, self.reserve))
+        self.shared -= self.reserve
+        
+    ## take room for a packet from the pool
+    # @param queue_bytes - bytes the queue holds before the packet
+    # @param size - bytes of the packet
+    # @return False if the packet does not fit
+    def acquire(self, queue_bytes, size):
+        extra = max(0, queue_bytes + size - self.reserve) - max(0, queue_bytes - self.reserve)
+        if extra == 0:
+            return True
+        with self.lock:
+            if self.shared_used + extra > self.shared:
+                return False
+            self.shared_used += extra
+        return True
+    
+    ## give back the room of a packet leaving a queue
+    # @param queue_bytes - bytes the queue held before the packet left
+    # @param size - bytes of the packet
+    def release(self, queue_bytes, size):
+        extra = max(0, queue_bytes - self.reserve) - max(0, queue_bytes - size - self.reserve)
+        if extra:
+            with self.lock:
+                self.shared_used -= extra
+                
+    ## called when printing the object
+    def __str__(self):
+        return 'BufferPool %d/%d shared bytes used, %d bytes reserved per queue' % (self.shared_used, self.shared, self.reserve)
+
+
+## A FIFO of packets limited by packet count, by bytes and by a shared
+# BufferPool. Packets that do not fit are dropped according to the drop
+# policy. Mirrors the get/put interface of queue.Queue.
+class PacketQueue:
+    
+    ## @param maxsize - the maximum number of packets, 0 for unlimited
+    # @param max_bytes - the maximum bytes of packets, 0 for unlimited
+    # @param buffer_pool - BufferPool the queue draws on, None for none
+    # @param drop_policy - 'tail' drops an arriving packet that does not fit,
+    #  'head' drops the oldest packets to make room for it
+    def __init__(self, maxsize=0, max_bytes=0, buffer_pool=None, drop_policy='tail'):
+        if drop_policy not in ('tail', 'head'):
+            raise Exception('Unknown drop policy %s' % drop_policy)
+        self.pkt_L = collections.deque()
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.buffer_pool = buffer_pool
+        self.drop_policy = drop_policy
+        self.bytes = 0 #bytes of the queued packets
+        self.drop_count = 0 #packets dropped on overflow
+        self.put_count = 0 #packets accepted
+        self.notify = None #called after each put, to wake the node or link that takes packets off the queue
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        if buffer_pool is not None:
+            buffer_pool.register()
+            
+    ## number of packets in the queue
+    def qsize(self):
+        return len(self.pkt_L)
+    
+    ## check the byte budget and take room from the pool, the caller holds the lock
+    def admit(self, size):
+        if self.max_bytes and self.bytes + size > self.max_bytes:
+            return False
+        return self.buffer_pool is None or self.buffer_pool.acquire(self.bytes, size)
+    
+    ## remove the oldest packet, the caller holds the lock
+    def pop(self):
+        pkt_S = self.pkt_L.popleft()
+        if self.buffer_pool is not None:
+            self.buffer_pool.release(self.bytes, len(pkt_S))
+        self.bytes -= len(pkt_S)
+        return pkt_S
+    
+    ## add a packet, making room according to the drop policy
+    # @param pkt_S - packet byte string
+    # @param block - if True, wait for room below maxsize, the byte budget and the pool never block
+    # @throws queue.Full if the packet is dropped
+    def put(self, pkt_S, block=False):
+        size = len(pkt_S)
+        with self.lock:
+            while self.maxsize and len(self.pkt_L) >= self.maxsize:
+                if block:
+                    self.not_full.wait()
+                    continue
+                self.drop_count += 1
+                if self.drop_policy != 'head':
+                    raise queue.Full
+                self.pop()
+            if self.max_bytes and size > self.max_bytes:
+                self.drop_count += 1
+                raise queue.Full #would not fit into an empty queue either
+            while not self.admit(size):
+                self.drop_count += 1
+                if self.drop_policy != 'head' or not self.pkt_L:
+                    raise queue.Full
+                self.pop()
+            self.pkt_L.append(pkt_S)
+            self.bytes += size
+            self.put_count += 1
+        if self.notify is not None:
+            self.notify()
+            
+    ## take the oldest packet
+    # @param block - kept for compatibility with queue.Queue, the queue never waits for packets
+    # @throws queue.Empty if there is no packet
+    def get(self, block=False):
+        with self.lock:
+            if not self.pkt_L:
+                raise queue.Empty
+            pkt_S = self.pop()
+            if self.maxsize:
+                self.not_full.notify()
+            return pkt_S
+        
 
 ## wrapper class for a queue of packets
 class Interface:
     ## @param maxsize - the maximum size of the queue storing packets
-    def __init__(self, maxsize=0):
-        self.in_queue = queue.Queue(maxsize)
-        self.out_queue = queue.Queue(maxsize)
+    # @param max_bytes - the maximum bytes of packets in each queue, 0 for unlimited
+    # @param buffer_pool - BufferPool shared with the other interfaces of the router, None for none
+    # @param drop_policy - 'tail' or 'head', see PacketQueue
+    def __init__(self, maxsize=0, max_bytes=0, buffer_pool=None, drop_policy='tail'):
+        self.in_queue = PacketQueue(maxsize, max_bytes, buffer_pool, drop_policy)
+        self.out_queue = PacketQueue(maxsize, max_bytes, buffer_pool, drop_policy)
+        
+    ## packets and bytes currently held by the interface queues
+    # @return {'in': (packets, bytes), 'out': (packets, bytes)}
+    def occupancy(self):
+        return {'in': (self.in_queue.qsize(), self.in_queue.bytes), 'out': (self.out_queue.qsize(), self.out_queue.bytes)}
     
     ##get packet from the queue interface
     # @param in_or_out - use 'in' or 'out' interface
@@ -39,19 +190,95 @@ class Interface:
             self.in_queue.put(pkt, block)
             
         
-## Implements a network layer packet.
+## Implements a network layer packet. Packets built from a byte string keep
+# the string and only decode their fields when first accessed.
 class NetworkPacket:
-    ## packet encoding lengths 
-    dst_S_length = 5
+    ## packet encoding lengths, the destination holds a host name or a 32 bit address
+    dst_S_length = 10
     prot_S_length = 1
+    ## traced data packets (protocol '3') carry a hex packet id before the payload
+    trace_id_S_length = 8
+    ## data packets carry the source host after the protocol field (and the trace id), so that flows can be told apart
+    src_S_length = 10
+    
+    __slots__ = ('_dst', '_prot_S', '_data_S', '_src', '_byte_S')
     
     ##@param dst: address of the destination host
     # @param data_S: packet payload
     # @param prot_S: upper layer protocol for the packet (data, or control)
-    def __init__(self, dst, prot_S, data_S):
-        self.dst = dst
-        self.data_S = data_S
-        self.prot_S = prot_S
+    # @param src: address of the source host of a data packet
+    def __init__(self, dst, prot_S, data_S, src=None):
+        self.reset(dst, prot_S, data_S, src)
+        
+    ## reinitialize the packet from its fields
+    def reset(self, dst, prot_S, data_S, src=None):
+        self._dst = dst
+        self._data_S = data_S
+        self._prot_S = prot_S
+        self._src = src
+        self._byte_S = None
+        
+    ## reinitialize the packet from a byte string, fields are decoded on first use
+    def reset_byte_S(self, byte_S):
+        self._dst = self._prot_S = self._data_S = self._src = None
+        self._byte_S = byte_S
+        
+    ## decode the fields of a packet created from a byte string
+    def decode(self):
+        byte_S = self._byte_S
+        prot_S = byte_S[NetworkPacket.dst_S_length : NetworkPacket.dst_S_length + NetworkPacket.prot_S_length]
+        if prot_S == '1':
+            self._prot_S = 'data'
+        elif prot_S == '2':
+            self._prot_S = 'control'
+        else:
+            raise Exception('%s: unknown prot_S field: %s' %(self, prot_S))
+        self._dst = self.decode_addr(byte_S[0 : NetworkPacket.dst_S_length])
+        start = NetworkPacket.dst_S_length + NetworkPacket.prot_S_length
+        if prot_S == '1':
+            self._src = self.decode_addr(byte_S[start : start + NetworkPacket.src_S_length]) or None
+            start += NetworkPacket.src_S_length
+        self._data_S = byte_S[start : ]
+        
+    @property
+    def dst(self):
+        if self._prot_S is None:
+            self.decode()
+        return self._dst
+    
+    @dst.setter
+    def dst(self, dst):
+        self.reset(dst, self.prot_S, self.data_S, self.src)
+    
+    @property
+    def prot_S(self):
+        if self._prot_S is None:
+            self.decode()
+        return self._prot_S
+    
+    @prot_S.setter
+    def prot_S(self, prot_S):
+        self.reset(self.dst, prot_S, self.data_S, self.src)
+        
+    @property
+    def data_S(self):
+        if self._prot_S is None:
+            self.decode()
+        return self._data_S
+    
+    @data_S.setter
+    def data_S(self, data_S):
+        self.reset(self.dst, self.prot_S, data_S, self.src)
+        
+    @property
+    def src(self):
+        if self._prot_S is None:
+            self.decode()
+        return self._src
+    
+    @src.setter
+    def src(self, src):
+        self.reset(self.dst, self.prot_S, self.data_S, src)
         
     ## called when printing the object
     def __str__(self):
@@ -59,40 +286,349 @@ class NetworkPacket:
         
     ## convert packet to a byte string for transmission over links
     def to_byte_S(self):
-        byte_S = str(self.dst).zfill(self.dst_S_length)
-        if self.prot_S == 'data':
-            byte_S += '1'
-        elif self.prot_S == 'control':
+        if self._byte_S is not None:
+            return self._byte_S
+        byte_S = self.encode_addr(self._dst, self.dst_S_length)
+        if self._prot_S == 'data':
+            byte_S += '1' + self.encode_addr(self._src, self.src_S_length)
+        elif self._prot_S == 'control':
             byte_S += '2'
         else:
-            raise('%s: unknown prot_S option: %s' %(self, self.prot_S))
-        byte_S += self.data_S
+            raise Exception('%s: unknown prot_S option: %s' %(self._dst, self._prot_S))
+        byte_S += self._data_S
+        self._byte_S = byte_S
         return byte_S
     
+    ## encode a host name or dotted address into a header field
+    # @param addr: host name, dotted address, or None for an empty field
+    # @param length: length of the field
+    @staticmethod
+    def encode_addr(addr, length):
+        if addr is None:
+            return '0' * length
+        if '.' in str(addr):
+            return str(addr_to_int(addr)).zfill(length)
+        return str(addr).zfill(length)
+    
+    ## decode a header field into a host name or dotted address, '' for an empty field
+    @staticmethod
+    def decode_addr(field_S):
+        addr_S = field_S.lstrip('0')
+        if addr_S.isdigit():
+            return int_to_addr(int(addr_S))
+        return addr_S
+    
     ## extract a packet object from a byte string
     # @param byte_S: byte string representation of the packet
     @classmethod
     def from_byte_S(self, byte_S):
-        dst = byte_S[0 : NetworkPacket.dst_S_length].strip('0')
-        prot_S = byte_S[NetworkPacket.dst_S_length : NetworkPacket.dst_S_length + NetworkPacket.prot_S_length]
-        if prot_S == '1':
-            prot_S = 'data'
-        elif prot_S == '2':
-            prot_S = 'control'
-        else:
-            raise('%s: unknown prot_S field: %s' %(self, prot_S))
-        data_S = byte_S[NetworkPacket.dst_S_length + NetworkPacket.prot_S_length : ]        
-        return self(dst, prot_S, data_S)
+        p = self.__new__(self)
+        p.reset_byte_S(byte_S)
+        return p
+    
+    ## read the destination field of a byte string without parsing the packet
+    # @param byte_S: byte string representation of the packet
+    # @return host name, or the address as a string of decimal digits
+    @staticmethod
+    def peek_dst(byte_S):
+        return byte_S[0 : NetworkPacket.dst_S_length].lstrip('0')
+    
+    ## read the protocol field of a byte string without parsing the packet
+    # @param byte_S: byte string representation of the packet
+    # @return '1' for data, '2' for control or '3' for traced data
+    @staticmethod
+    def peek_prot(byte_S):
+        return byte_S[NetworkPacket.dst_S_length]
+    
+    ## read the source field of a data or traced data packet without parsing it
+    # @param byte_S: byte string representation of the packet
+    # @return the source field as encoded, names and addresses zero padded
+    @staticmethod
+    def peek_src(byte_S):
+        start = NetworkPacket.dst_S_length + NetworkPacket.prot_S_length
+        if byte_S[NetworkPacket.dst_S_length] == '3':
+            start += NetworkPacket.trace_id_S_length
+        return byte_S[start : start + NetworkPacket.src_S_length]
+    
+    
+## A free list of NetworkPacket objects reused for control messages
+class PacketPool:
+    
+    ## @param maxsize - the maximum number of free packets kept for reuse
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.free_L = []
+        self.alloc_count = 0 #packets allocated because the free list was empty
+        
+    ## get a packet from the pool
+    def get(self, dst, prot_S, data_S):
+        try:
+            p = self.free_L.pop()
+        except IndexError:
+            self.alloc_count += 1
+            return NetworkPacket(dst, prot_S, data_S)
+        p.reset(dst, prot_S, data_S)
+        return p
+        
+    ## get a packet from the pool for a received byte string
+    def from_byte_S(self, byte_S):
+        try:
+            p = self.free_L.pop()
+        except IndexError:
+            self.alloc_count += 1
+            return NetworkPacket.from_byte_S(byte_S)
+        p.reset_byte_S(byte_S)
+        return p
+    
+    ## return a packet that is no longer referenced to the pool
+    def release(self, p):
+        if len(self.free_L) < self.maxsize:
+            self.free_L.append(p)
     
 
     
 
+## convert a dotted address such as '10.0.1.2' to a 32 bit integer
+def addr_to_int(addr_S):
+    n = 0
+    for octet_S in addr_S.split('.'):
+        n = (n << 8) | int(octet_S)
+    return n
+
+
+## convert a 32 bit integer to a dotted address
+def int_to_addr(n):
+    return '%d.%d.%d.%d' % (n >> 24, (n >> 16) & 255, (n >> 8) & 255, n & 255)
+
+
+## split a prefix such as '10.0.1.0/24' into its masked address and length
+def parse_prefix(prefix_S):
+    addr_S, length_S = prefix_S.split('/')
+    length = int(length_S)
+    return addr_to_int(addr_S) & prefix_mask(length), length
+
+
+## True if a 32 bit address is a multicast group address (224.0.0.0/4)
+def is_multicast(n):
+    return (n >> 28) == 14
+
+
+## netmask of a prefix length as a 32 bit integer
+def prefix_mask(length):
+    return (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+
+
+## A node of a PrefixTrie
+class TrieNode:
+    
+    __slots__ = ('key', 'length', 'value', 'child_L')
+    
+    def __init__(self, key, length, value):
+        self.key = key #prefix bits, masked to length
+        self.length = length
+        self.value = value #None for nodes that only join two branches
+        self.child_L = [None, None]
+        
+        
+## A path compressed binary trie for longest prefix match on 32 bit addresses.
+# Nodes only exist where a prefix ends or two prefixes branch, so a lookup
+# visits at most one node per stored prefix length on its path.
+class PrefixTrie:
+    
+    def __init__(self):
+        self.root = TrieNode(0, 0, None)
+        self.size = 0 #number of prefixes stored
+        
+    ## store a value for a prefix
+    # @param key: prefix address as a 32 bit integer
+    # @param length: prefix length
+    # @param value: value returned by lookups matching the prefix
+    def insert(self, key, length, value):
+        key &= prefix_mask(length)
+        node = self.root
+        while True:
+            if length == node.length:
+                if node.value is None:
+                    self.size += 1
+                node.value = value
+                return
+            bit = (key >> (31 - node.length)) & 1
+            child = node.child_L[bit]
+            if child is None:
+                node.child_L[bit] = TrieNode(key, length, value)
+                self.size += 1
+                return
+            common = min(length, child.length, 32 - (key ^ child.key).bit_length())
+            if common == child.length:
+                node = child
+                continue
+            #split the edge to the child where the prefixes diverge
+            mid = TrieNode(key & prefix_mask(common), common, None)
+            node.child_L[bit] = mid
+            mid.child_L[(child.key >> (31 - common)) & 1] = child
+            if common == length:
+                mid.value = value
+            else:
+                mid.child_L[(key >> (31 - common)) & 1] = TrieNode(key, length, value)
+            self.size += 1
+            return
+        
+    ## remove a prefix
+    # @param key: prefix address as a 32 bit integer
+    # @param length: prefix length
+    def remove(self, key, length):
+        key &= prefix_mask(length)
+        parent, node = None, self.root
+        while node is not None and node.length < length:
+            parent, node = node, node.child_L[(key >> (31 - node.length)) & 1]
+        if node is None or node.length != length or node.key != key or node.value is None:
+            return
+        node.value = None
+        self.size -= 1
+        #splice out nodes that no longer join two branches
+        child_L = [child for child in node.child_L if child is not None]
+        if parent is not None and len(child_L) < 2:
+            parent.child_L[parent.child_L.index(node)] = child_L[0] if child_L else None
+        
+    ## find the value of the longest prefix matching an address
+    # @param addr: 32 bit integer address
+    # @return the value, or None if no prefix matches
+    def lookup(self, addr):
+        node = self.root
+        best = None
+        while node is not None:
+            if (addr & prefix_mask(node.length)) != node.key:
+                break
+            if node.value is not None:
+                best = node.value
+            if node.length == 32:
+                break
+            node = node.child_L[(addr >> (31 - node.length)) & 1]
+        return best
+        
+
+## An immutable view of a router's forwarding state. The control plane
+# builds a new snapshot when routes change and publishes it with a single
+# assignment, so forwarding reads a consistent table without taking locks.
+class RouteSnapshot:
+    
+    __slots__ = ('version', 'route_D', 'fib', 'mcast_D', 'core_D')
+    
+    ## @param version - number of the snapshot, increasing with each one published
+    # @param route_D - outgoing interfaces of each reachable destination, several for equal cost paths {destination: (interface,)}
+    # @param fib - PrefixTrie matching addresses to the reachable prefix destinations
+    # @param mcast_D - interfaces on the shared tree of each group joined {group: frozenset(interfaces)}
+    # @param core_D - interface toward the core of each group, None at the core or if unreachable {group: interface}
+    def __init__(self, version, route_D, fib, mcast_D, core_D):
+        self.version = version
+        self.route_D = route_D
+        self.fib = fib
+        self.mcast_D = mcast_D
+        self.core_D = core_D
+        
+        
+## A timer scheduled on a TimerWheel
+class Timer:
+    
+    __slots__ = ('expires', 'callback', 'args', 'cancelled')
+    
+    def __init__(self, expires, callback, args):
+        self.expires = expires #tick at which the timer fires
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        
+    ## stop the timer from firing, it is dropped from the wheel when its slot comes up
+    def cancel(self):
+        self.cancelled = True
+        
+        
+## A hierarchical timer wheel shared by all routers for their protocol timers.
+# Level 0 has one slot per tick, each higher level has slots spanning a full
+# turn of the level below, whose timers are cascaded down when it wraps.
+# Scheduling, cancelling and each tick cost O(1) however many timers are pending.
+class TimerWheel:
+    
+    ## @param tick_time - seconds per tick
+    # @param slots - number of slots on each level
+    # @param levels - number of levels
+    def __init__(self, tick_time=0.01, slots=64, levels=4):
+        self.tick_time = tick_time
+        self.slots = slots
+        self.levels = levels
+        self.wheel_L = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.tick = 0 #ticks elapsed
+        self.lock = threading.Lock()
+        self.stop = False #for thread termination
+        
+    ## called when printing the object
+    def __str__(self):
+        return 'TimerWheel'
+    
+    ## call a function after a delay
+    # @param delay - seconds until the timer fires
+    # @param callback - function to call
+    # @param args - arguments for the function
+    # @return Timer that can be cancelled
+    def schedule(self, delay, callback, *args):
+        with self.lock:
+            timer = Timer(self.tick + max(1, int(round(delay / self.tick_time))), callback, args)
+            self.insert(timer)
+        return timer
+    
+    ## place a timer in the slot for its expiry, the caller holds the lock
+    def insert(self, timer):
+        ticks = timer.expires - self.tick
+        for level in range(self.levels):
+            span = self.slots ** level
+            if ticks < span * self.slots or level == self.levels - 1:
+                #timers beyond the top level are parked in its last slot and placed again when it wraps
+                expires = min(timer.expires, self.tick + span * (self.slots - 1))
+                self.wheel_L[level][(expires // span) % self.slots].append(timer)
+                return
+            
+    ## advance the wheel by one tick and fire the timers that expired
+    def advance(self):
+        with self.lock:
+            self.tick += 1
+            #cascade timers from higher levels whose slot came up
+            for level in range(1, self.levels):
+                span = self.slots ** level
+                if self.tick % span:
+                    break
+                slot_L = self.wheel_L[level][(self.tick // span) % self.slots]
+                self.wheel_L[level][(self.tick // span) % self.slots] = []
+                for timer in slot_L:
+                    if not timer.cancelled:
+                        self.insert(timer)
+            slot_L = self.wheel_L[0][self.tick % self.slots]
+            self.wheel_L[0][self.tick % self.slots] = []
+        for timer in slot_L:
+            if not timer.cancelled:
+                timer.callback(*timer.args)
+    
+    ## thread target for the wheel to keep ticking
+    def run(self):
+        print (threading.currentThread().getName() + ': Starting')
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick_time
+            time.sleep(max(0, next_tick - time.monotonic()))
+            self.advance()
+            if self.stop:
+                print (threading.currentThread().getName() + ': Ending')
+                return
+    
+
 ## Implements a network host for receiving and transmitting data
 class Host:
     
     ##@param addr: address of this node represented as an integer
-    def __init__(self, addr):
+    # @param ip_addr: dotted network address of the host interface, if any
+    def __init__(self, addr, ip_addr=None):
         self.addr = addr
+        self.ip_addr = ip_addr
+        self.group_S = set() #multicast groups this host is a member of
         self.intf_L = [Interface()]
         self.stop = False #for thread termination
     
@@ -104,15 +640,45 @@ class Host:
     # @param dst: destination address for the packet
     # @param data_S: data being transmitted to the network layer
     def udt_send(self, dst, data_S):
-        p = NetworkPacket(dst, 'data', data_S)
-        print('%s: sending packet "%s"' % (self, p))
+        p = NetworkPacket(dst, 'data', data_S, self.ip_addr if self.ip_addr is not None else self.addr)
+        if self.ip_addr is not None:
+            print('%s (%s): sending packet "%s" to %s' % (self, self.ip_addr, p, dst))
+        else:
+            print('%s: sending packet "%s"' % (self, p))
         self.intf_L[0].put(p.to_byte_S(), 'out') #send packets always enqueued successfully
         
+    ## join a multicast group and report the membership to our router
+    # @param group: dotted multicast group address
+    def join(self, group):
+        self.group_S.add(group)
+        p = NetworkPacket(group, 'control', 'JOIN:%s' % group)
+        print('%s: joining group %s' % (self, group))
+        self.intf_L[0].put(p.to_byte_S(), 'out')
+        
+    ## leave a multicast group and report it to our router
+    # @param group: dotted multicast group address
+    def leave(self, group):
+        self.group_S.discard(group)
+        p = NetworkPacket(group, 'control', 'LEAVE:%s' % group)
+        print('%s: leaving group %s' % (self, group))
+        self.intf_L[0].put(p.to_byte_S(), 'out')
+        
+    ## one non-blocking step of the host, for schedulers that run nodes without their own threads
+    # @return number of packets received, 0 when the host was idle
+    def step(self):
+        return 0 if self.udt_receive() is None else 1
+    
     ## receive packet from the network layer
+    # @return the packet received, None if there was none
     def udt_receive(self):
         pkt_S = self.intf_L[0].get('in')
-        if pkt_S is not None:
-            print('%s: received packet "%s"' % (self, pkt_S))
+        #hosts do not take part in routing, ignore control packets
+        if pkt_S is not None and NetworkPacket.peek_prot(pkt_S) != '2':
+            if self.ip_addr is not None:
+                print('%s (%s): received packet "%s"' % (self, self.ip_addr, pkt_S))
+            else:
+                print('%s: received packet "%s"' % (self, pkt_S))
+        return pkt_S
        
     ## thread target for the host to keep receiving data
     def run(self):
@@ -130,89 +696,209 @@ class Host:
 ## Implements a multi-interface router
 class Router:
     
+    ## routes carried by one routing update packet
+    routes_per_pkt = 25
+    ## flap damping: penalty for a route becoming reachable again, higher for a route becoming
+    # unreachable, and the penalties above which triggered updates of the route are suppressed
+    # and below which they are used again, the penalty halves every flap_half_life seconds
+    flap_penalty = 500
+    flap_withdraw_penalty = 1000
+    flap_suppress = 3000
+    flap_reuse = 750
+    
     ##@param name: friendly router name for debugging
     # @param cost_D: cost table to neighbors {neighbor: {interface: cost}}
     # @param max_queue_size: max queue length (passed to Interface)
-    def __init__(self, name, cost_D, max_queue_size):
+    # @param infinity: cost at which a destination is considered unreachable
+    # @param split_horizon: do not advertise routes back to the neighbor they were learned from
+    # @param poisoned_reverse: advertise such routes back with cost infinity instead of omitting them
+    # @param mode: routing protocol, 'dv' for distance vector or 'ls' for link state
+    # @param pool_size: number of control packet objects kept for reuse, 0 disables pooling
+    # @param addr_D: interface addresses with the prefix length of their link {interface: 'a.b.c.d/len'}
+    # @param mcast_core_D: core router of each multicast group's shared tree {group: router name}
+    # @param max_queue_bytes: max bytes in each interface queue (passed to Interface), 0 for unlimited
+    # @param buffer_size: bytes of a buffer shared by all interface queues, 0 for none
+    # @param buffer_reserve: bytes of the shared buffer guaranteed to each queue
+    # @param drop_policy: 'tail' or 'head', which packets are dropped when a queue overflows
+    # @param forwarding_workers: number of data plane threads forwarding data packets, each from a share of the
+    #  interfaces, while the router's own thread is the control plane. 0 runs both planes on the router's thread
+    def __init__(self, name, cost_D, max_queue_size, infinity=INFINITY, split_horizon=False, poisoned_reverse=False, mode='dv', pool_size=64, addr_D=None, mcast_core_D=None,
+                 max_queue_bytes=0, buffer_size=0, buffer_reserve=0, drop_policy='tail', forwarding_workers=1):
         self.stop = False #for thread termination
+        self.forwarding_workers = forwarding_workers
+        self.ctrl_Q = queue.Queue() # (function, arguments) of control work: control packets, timers and link events
+        self.notify = None #called after work is posted, to wake the router when a scheduler steps it
         self.name = name
+        self.flow_seed = zlib.crc32(name.encode()) #seed of the flow hash choosing among equal cost paths
         #create a list of interfaces
-        self.intf_L = [Interface(max_queue_size) for _ in range(len(cost_D))]
+        self.buffer_pool = BufferPool(buffer_size, buffer_reserve) if buffer_size else None
+        self.intf_L = [Interface(max_queue_size, max_queue_bytes, self.buffer_pool, drop_policy) for _ in range(len(cost_D))]
         #save neighbors and interfeces on which we connect to them
         self.cost_D = cost_D    # {neighbor: {interface: cost}}
-        #TODO: set up the routing table for connected hosts
-        if (self.name=='RA'):
-            self.rt_tbl_D = {'H1':{'RA': self.cost_D['H1'][0]}, 'RB':{'RA': self.cost_D['RB'][1]}, 'H2':{'RA':100}, 'RA':{'RA':0}, 'RC':{'RA': self.cost_D['RC'][2]}, 'RD':{'RA': 100}}      # {destination: {router: cost}}
-            self.rt_tb2_D = {'H1':{'RB': 100}, 'RB':{'RB': 100}, 'H2':{'RB':100}, 'RA':{'RB':100}, 'RC':{'RB': 100}, 'RD':{'RB': 100}}
-            self.rt_tb3_D = {'H1':{'RC': 100}, 'RB':{'RC': 100}, 'H2':{'RC':100}, 'RA':{'RC':100}, 'RC':{'RC': 100}, 'RD':{'RC': 100}}      # {destination: {router: cost}}
-            self.rt_tb4_D = {'H1':{'RD': 100}, 'RB':{'RD': 100}, 'H2':{'RD':100}, 'RA':{'RD':100}, 'RC':{'RD': 100}, 'RD':{'RD': 100}}
-                             
-        elif (self.name=='RB'):
-            self.rt_tbl_D = {'H1':{'RA': 100}, 'RB':{'RA': 100}, 'H2':{'RA':100}, 'RA':{'RA':100},   'RC':{'RA': 100}, 'RD':{'RA': 100}}      # {destination: {router: cost}}
-            self.rt_tb2_D = {'H1':{'RB': 100}, 'RB':{'RB': 0}, 'H2':{'RB':100}, 'RA':{'RB':self.cost_D['RA'][0]}, 'RC':{'RB': 100}, 'RD':{'RB': self.cost_D['RD'][1]}}
-            self.rt_tb3_D = {'H1':{'RC': 100}, 'RB':{'RC': 100}, 'H2':{'RC':100}, 'RA':{'RC':100}, 'RC':{'RC': 100}, 'RD':{'RC': 100}}      # {destination: {router: cost}}
-            self.rt_tb4_D = {'H1':{'RD': 100}, 'RB':{'RD': 100}, 'H2':{'RD':100}, 'RA':{'RD':100}, 'RC':{'RD': 100}, 'RD':{'RD': 100}}
-
-        elif (self.name=='RC'):
-            self.rt_tbl_D = {'H1':{'RA': 100}, 'RB':{'RA': 100}, 'H2':{'RA':100}, 'RA':{'RA':100},   'RC':{'RA': 100}, 'RD':{'RA': 100}}      # {destination: {router: cost}}
-            self.rt_tb2_D = {'H1':{'RB': 100}, 'RB':{'RB': 100}, 'H2':{'RB':100}, 'RA':{'RB':100}, 'RC':{'RB': 100}, 'RD':{'RB': 100}}
-            self.rt_tb3_D = {'H1':{'RC': 100}, 'RB':{'RC': 100}, 'H2':{'RC':100}, 'RA':{'RC':self.cost_D['RA'][0]}, 'RC':{'RC': 0}, 'RD':{'RC': self.cost_D['RD'][1]}}      # {destination: {router: cost}}
-            self.rt_tb4_D = {'H1':{'RD': 100}, 'RB':{'RD': 100}, 'H2':{'RD':100}, 'RA':{'RD':100}, 'RC':{'RD': 100}, 'RD':{'RD': 100}}
-        elif (self.name=='RD'):
-            self.rt_tbl_D = {'H1':{'RA': 100}, 'RB':{'RA': 100}, 'H2':{'RA':100}, 'RA':{'RA':100},   'RC':{'RA': 100}, 'RD':{'RA': 100}}      # {destination: {router: cost}}
-            self.rt_tb2_D = {'H1':{'RB': 100}, 'RB':{'RB': 100}, 'H2':{'RB':100}, 'RA':{'RB':100}, 'RC':{'RB': 100}, 'RD':{'RB': 100}}
-            self.rt_tb3_D = {'H1':{'RC': 100}, 'RB':{'RC': 100}, 'H2':{'RC':100}, 'RA':{'RC':100}, 'RC':{'RC': 100}, 'RD':{'RC': 100}}      # {destination: {router: cost}}
-            self.rt_tb4_D = {'H1':{'RD': 100}, 'RB':{'RD': self.cost_D['RB'][0]}, 'H2':{'RD':self.cost_D['H2'][2]}, 'RA':{'RD':100}, 'RC':{'RD': self.cost_D['RC'][1]}, 'RD':{'RD': 0}}
-            
+        self.intf_D = {}        # {interface: neighbor}
+        for nbr, intf_cost_D in self.cost_D.items():
+            for intf in intf_cost_D:
+                self.intf_D[intf] = nbr
+        #interface addresses and the prefixes of the links they connect to
+        self.addr_D = addr_D if addr_D is not None else {}
+        self.conn_D = {}        # {prefix: neighbor on the link}
+        for intf, addr_S in self.addr_D.items():
+            key, length = parse_prefix(addr_S)
+            self.conn_D['%s/%d' % (int_to_addr(key), length)] = self.intf_D[intf]
+        #our name and interface addresses as they appear in packet headers
+        self.own_S = {self.name} | {str(addr_to_int(addr_S.split('/')[0])) for addr_S in self.addr_D.values()}
+        #shared multicast trees, joined hop by hop toward each group's core
+        self.mcast_core_D = {addr_to_int(group): core for group, core in (mcast_core_D or {}).items()}
+        self.downstream_D = {}  # {group: {interfaces with members behind them}}
+        self.upstream_D = {}    # {group: interface toward the core, None at the core}
+        self.infinity = infinity
+        self.split_horizon = split_horizon
+        self.poisoned_reverse = poisoned_reverse
+        self.down_cost_D = {}   # {interface: cost before the link failed}
+        self.clock = time.monotonic #replaced by a virtual clock when run deterministically
+        self.rng = random.Random() #jitter of the protocol timers, seeded when run deterministically
+        self.last_change_time = self.clock() #when our own routes last changed
+        if mode not in ('dv', 'ls'):
+            raise Exception('%s: unknown routing mode %s' % (self, mode))
+        self.mode = mode
+        self.pkt_pool = PacketPool(pool_size)
+        self.wheel = None #TimerWheel running our protocol timers, set by start_timers()
+        self.expiry_D = {}  # {(destination, neighbor) or origin: route expiry Timer}
+        #triggered updates waiting to go out, their hold-down and flap damping state
+        self.pending_S = set()      #destinations to go into the next triggered update
+        self.trigger_timer = None   #Timer sending the next triggered update
+        self.held_D = {}            # {destination: time until which it is held down}
+        self.penalty_D = {}         # {destination: (flap penalty, time it was last updated)}
+        self.reachable_D = {}       # {destination: whether it was reachable at its last change}
+        self.adv_cost_D = {}        # {destination: cost we last advertised}
+        self.suppressed_S = set()   #destinations left out of triggered updates while they flap
+        self.ctrl_sent_count = 0    #control packets we sent
+        self.change_sent_count = 0  #of those the ones sent for a change, not to refresh unchanged routes
+        self.no_route_count = 0     #data packets dropped for lack of a route or multicast tree
+        self.local_count = 0        #data packets addressed to the router itself
+        self.shown_D = {}   # {destination: {router: cost}} as last rendered with changed_only
+        #forwarding reads the published snapshot, the control plane collects changes for the next one
+        self.snapshot = RouteSnapshot(0, {}, PrefixTrie(), {}, {})
+        self.changed_S = set()      #destinations whose route changed since the last snapshot
+        self.mcast_changed = False  #multicast trees changed since the last snapshot
+        self.publish_lock = threading.Lock()
+        #link state database with our own advertisement
+        self.lsdb_D = {self.name: (1, self.lsa_costs())} # {origin: (sequence number, {neighbor: cost})}
+        self.synced_S = set() #interfaces on which we have sent our link state database
+        #set up the routing table for directly connected neighbors
+        self.rt_tbl_D = {self.name: {self.name: 0}}     # {destination: {router: cost}}
+        self.next_hop_D = {self.name: self.name}        # {destination: neighbor}
+        #runner-up paths and the destinations that depend on each neighbor,
+        # so that a change from one neighbor only recomputes what it affects
+        self.second_D = {}                              # {destination: (cost, neighbor)}
+        self.ecmp_D = {}                                # {destination: [neighbors]} when several paths tie for best
+        self.dep_D = {nbr: set() for nbr in self.cost_D} # {neighbor: {destinations with best or second best path through it}}
+        self.adv_D = {nbr: set() for nbr in self.cost_D} # {neighbor: {destinations it advertised}}
+        for dst in list(self.cost_D) + list(self.conn_D):
+            self.add_destination(dst)
+            self.recompute_route(dst)
+        self.publish()
         print('%s: Initialized routing table' % self)
         
         self.print_routes()
     
+    
+    ## cost of the link to a neighbor, capped at infinity
+    # @param nbr: name of the neighbor
+    def link_cost(self, nbr):
+        return min(list(self.cost_D[nbr].values())[0], self.infinity)
+    
+    
+    ## link costs advertised in our link state advertisement, including
+    # the prefixes of our links as stub destinations
+    def lsa_costs(self):
+        cost_D = {nbr: self.link_cost(nbr) for nbr in self.cost_D}
+        for prefix, nbr in self.conn_D.items():
+            cost_D[prefix] = self.link_cost(nbr)
+        return cost_D
+    
+    
+    ## create the routing table row for a destination
+    # @param dst: host or router name, or prefix 'a.b.c.d/len'
+    def add_destination(self, dst):
+        if dst not in self.rt_tbl_D:
+            self.rt_tbl_D[dst] = {}
+        return self.rt_tbl_D[dst]
+    
+    
+    ## remove the routing table row of a destination
+    # @param dst: host or router name, or prefix 'a.b.c.d/len'
+    def remove_destination(self, dst):
+        del self.rt_tbl_D[dst]
+        self.next_hop_D.pop(dst, None)
+        self.second_D.pop(dst, None)
+        self.ecmp_D.pop(dst, None)
+        self.reachable_D.pop(dst, None)
+        self.adv_cost_D.pop(dst, None)
+        self.changed_S.add(dst)
+    
+    
+    ## interface on which a neighbor is connected
+    # @param nbr: name of the neighbor
+    def nbr_intf(self, nbr):
+        return list(self.cost_D[nbr].keys())[0]
+        
         
+    ## render the routing table into one string, a column per destination and a row per router
+    # @param changed_only: only show destinations whose costs changed since the last changed_only
+    #  rendering, removed destinations show as '-'. Returns '' when nothing changed.
+    def format_routes(self, changed_only=False):
+        if changed_only:
+            dst_L = sorted(dst for dst in self.rt_tbl_D.keys() | self.shown_D.keys()
+                           if self.rt_tbl_D.get(dst) != self.shown_D.get(dst))
+            if not dst_L:
+                return ''
+            for dst in dst_L:
+                if dst in self.rt_tbl_D:
+                    self.shown_D[dst] = dict(self.rt_tbl_D[dst])
+                else:
+                    del self.shown_D[dst]
+        else:
+            dst_L = sorted(self.rt_tbl_D)
+        empty_D = {}
+        col_L = [self.rt_tbl_D.get(dst, empty_D) for dst in dst_L]
+        rtr_L = sorted({rtr for rtr_D in col_L for rtr in rtr_D} | {self.name})
+        name_width = max(len(rtr) for rtr in rtr_L)
+        width = max([5] + [len(dst) for dst in dst_L])
+        line_S = ' ' + '_' * (name_width + 3 + (width + 3) * len(dst_L))
+        cell_S = '%%%ds |' % width
+        line_L = [line_S, '| %-*s |' % (name_width, self.name) + ''.join([' ' + cell_S % dst for dst in dst_L]), line_S]
+        for rtr in rtr_L:
+            line_L.append('| %-*s |' % (name_width, rtr) + ''.join([' ' + cell_S % rtr_D.get(rtr, '-') for rtr_D in col_L]))
+            line_L.append(line_S)
+        return '\n'.join(line_L)
+
+
     ## Print routing table
-    def print_routes(self):
-        #TODO: print the routes as a two dimensional table
-        print(" ______________________________________________________________________")
-        print("| %s |" % (self.name), end =" ")
-        print("  H1   |", end=" ")
-        print("  H2   |", end=" ")
-        print("  RA   |", end=" ")
-        print("  RB   |", end=" ")
-        print("  RC   |", end=" ")
-        print("  RD   |")
-        print(" ______________________________________________________________________")
-        print("| RA |", end =" ")
-        print("  %d   |" % self.rt_tbl_D['H1']['RA'], end=" ")
-        print("  %d   |" % self.rt_tbl_D['H2']['RA'], end=" ")
-        print("  %d   |" % self.rt_tbl_D['RA']['RA'], end=" ")
-        print("  %d   |" % self.rt_tbl_D['RB']['RA'], end=" ")
-        print("  %d   |" % self.rt_tbl_D['RC']['RA'], end=" ")
-        print("  %d   |" % self.rt_tbl_D['RD']['RA'])
-        print(" ______________________________________________________________________")
-        print("| RB |", end =" ")
-        print("  %d   |" % self.rt_tb2_D['H1']['RB'], end=" ")
-        print("  %d   |" % self.rt_tb2_D['H2']['RB'], end=" ")
-        print("  %d   |" % self.rt_tb2_D['RA']['RB'], end=" ")
-        print("  %d   |" % self.rt_tb2_D['RB']['RB'], end=" ")
-        print("  %d   |" % self.rt_tb2_D['RC']['RB'], end=" ")
-        print("  %d   |" % self.rt_tb2_D['RD']['RB'])
-        print(" ______________________________________________________________________")
-        print("| RC |", end =" ")
-        print("  %d   |" % self.rt_tb3_D['H1']['RC'], end=" ")
-        print("  %d   |" % self.rt_tb3_D['H2']['RC'], end=" ")
-        print("  %d   |" % self.rt_tb3_D['RA']['RC'], end=" ")
-        print("  %d   |" % self.rt_tb3_D['RB']['RC'], end=" ")
-        print("  %d   |" % self.rt_tb3_D['RC']['RC'], end=" ")
-        print("  %d   |" % self.rt_tb3_D['RD']['RC'])
-        print(" ______________________________________________________________________")
-        print("| RD |", end =" ")
-        print("  %d   |" % self.rt_tb4_D['H1']['RD'], end=" ")
-        print("  %d   |" % self.rt_tb4_D['H2']['RD'], end=" ")
-        print("  %d   |" % self.rt_tb4_D['RA']['RD'], end=" ")
-        print("  %d   |" % self.rt_tb4_D['RB']['RD'], end=" ")
-        print("  %d   |" % self.rt_tb4_D['RC']['RD'], end=" ")
-        print("  %d   |" % self.rt_tb4_D['RD']['RD'])
-        print(" ______________________________________________________________________")
+    # @param changed_only: only print destinations whose costs changed since the last such print
+    def print_routes(self, changed_only=False):
+        table_S = self.format_routes(changed_only)
+        if table_S:
+            print(table_S)
+
+
+    ## packets forwarded, multicast copies counted separately. Everything put on
+    # the out queues is either forwarded or one of our own control packets, so
+    # forwarding does not count anything itself.
+    def forwarded_count(self):
+        return sum(intf.out_queue.put_count for intf in self.intf_L) - self.ctrl_sent_count
+
+
+    ## packets and bytes held by each interface queue, packets dropped and the shared buffer use
+    def format_queues(self):
+        line_L = ['%s: interface queues (packets/bytes)' % self]
+        for i, intf in enumerate(self.intf_L):
+            occ_D = intf.occupancy()
+            line_L.append('  %d: in %d/%d out %d/%d dropped %d' % ((i,) + occ_D['in'] + occ_D['out'] + \
+                (intf.in_queue.drop_count + intf.out_queue.drop_count,)))
+        if self.buffer_pool is not None:
+            line_L.append('  %s' % self.buffer_pool)
+        return '\n'.join(line_L)
 
 
     ## called when printing the object
@@ -220,257 +906,801 @@ class Router:
         return self.name
 
 
-    ## look through the content of incoming interfaces and 
-    # process data and control packets
+    ## one non-blocking step of the router, for schedulers that run nodes without their own threads
+    # @return number of packets processed, 0 when the router was idle
+    def step(self):
+        return self.process_queues()
+
+
+    ## look through the content of incoming interfaces, forward the data
+    # packets, then process the control packets that arrived, so that a
+    # routing update never holds up data waiting on the other interfaces
+    # @return number of packets processed, 0 when the router was idle
     def process_queues(self):
-        for i in range(len(self.intf_L)):
-            pkt_S = None
-            #get packet from interface i
+        count = self.forward_queues(range(len(self.intf_L)))
+        if not self.ctrl_Q.empty():
+            self.process_control(0)
+        return count
+            
+
+
+    ## forward the data packets arriving on some of the interfaces and pass
+    # control packets on to the control plane, the step of the data plane
+    # @param i_L: interfaces owned by the worker
+    # @return number of packets taken off the interfaces
+    def forward_queues(self, i_L):
+        count = 0
+        for i in i_L:
             pkt_S = self.intf_L[i].get('in')
-            #if packet exists make a forwarding decision
             if pkt_S is not None:
-                p = NetworkPacket.from_byte_S(pkt_S) #parse a packet out
-                if p.prot_S == 'data':
-                    self.forward_packet(p,i)
-                elif p.prot_S == 'control':
-                    self.update_routes(p, i)
+                count += 1
+                #data packets are forwarded as they arrived, only control packets are parsed
+                prot_S = NetworkPacket.peek_prot(pkt_S)
+                if prot_S == '2':
+                    self.ctrl_Q.put((self.process_control_packet, (pkt_S, i)))
+                elif prot_S in ('1', '3'):
+                    self.forward_packet(pkt_S, i)
                 else:
-                    raise Exception('%s: Unknown packet type in packet %s' % (self, p))
-            
+                    raise Exception('%s: Unknown packet type in packet %s' % (self, pkt_S))
+        return count
+    
+    
+    ## thread target for a data plane worker
+    # @param i_L: interfaces owned by the worker
+    def forwarding_worker(self, i_L):
+        print (threading.currentThread().getName() + ': Starting')
+        while not self.stop:
+            self.forward_queues(i_L)
+        print (threading.currentThread().getName() + ': Ending')
+        
+        
+    ## hand work to the control plane, the only thread that changes routing
+    # state. Timer callbacks and link events from other threads come through here.
+    # @param func: control plane method to call
+    # @param args: its arguments
+    def post(self, func, *args):
+        self.ctrl_Q.put((func, args))
+        if self.notify is not None:
+            self.notify()
+        
+        
+    ## process the control packets handed over by the data plane and the work
+    # posted by timers and link events, then publish the resulting routes,
+    # the step of the control plane
+    # @param timeout: seconds to wait for the first item, 0 to not wait
+    # @return number of control packets and other work items processed
+    def process_control(self, timeout=0.01):
+        count = 0
+        try:
+            func, args = self.ctrl_Q.get(timeout > 0, timeout or None)
+            while True:
+                count += 1
+                func(*args)
+                func, args = self.ctrl_Q.get(False)
+        except queue.Empty:
+            self.publish() #one snapshot for the whole batch
+            return count
+        
+        
+    ## update routes from a control packet handed over by the data plane
+    # @param pkt_S: packet byte string
+    # @param i: interface the packet arrived on
+    def process_control_packet(self, pkt_S, i):
+        p = self.pkt_pool.from_byte_S(pkt_S)
+        self.update_routes(p, i)
+        self.pkt_pool.release(p)
 
 
     ## forward the packet according to the routing table
-    #  @param p Packet to forward
-    #  @param i Incoming interface number for packet p
-    def forward_packet(self, p, i):
+    #  @param pkt_S Byte string of the packet to forward, passed on unchanged
+    #  @param i Incoming interface number for packet pkt_S
+    def forward_packet(self, pkt_S, i):
+        snapshot = self.snapshot #the whole lookup uses one version of the table
+        dst = NetworkPacket.peek_dst(pkt_S)
+        if dst.isdigit() and is_multicast(int(dst)):
+            self.forward_multicast(pkt_S, i, int(dst), snapshot)
+            return
+        if dst in self.own_S:
+            self.local_count += 1
+            print('%s: received packet "%s"' % (self, pkt_S))
+            return
+        if dst.isdigit(): #addresses are routed on the longest matching prefix
+            dst = snapshot.fib.lookup(int(dst))
+        j_L = snapshot.route_D.get(dst)
+        if j_L is None:
+            self.no_route_count += 1
+            print('%s: no route to %s, packet "%s" dropped' % (self, NetworkPacket.peek_dst(pkt_S), pkt_S))
+            return
+        j = j_L[self.flow_hash(pkt_S) % len(j_L)] if len(j_L) > 1 else j_L[0]
+        if j == i and dst in self.conn_D:
+            #the link it came from holds no node with that address, sending it back would loop
+            self.no_route_count += 1
+            print('%s: no node %s on the link of interface %d, packet "%s" dropped' % (self, NetworkPacket.peek_dst(pkt_S), i, pkt_S))
+            return
         try:
-        #     # TODO: Here you will need to implement a lookup into the
-        #     # forwarding table to find the appropriate outgoing interface
-        #     # for now we assume the outgoing interface is 1
-        #
-            j = list(self.rt_tbl_D.get(str(p.dst)).values())[0]
-            if j == 100 and i == 0:
-                j = 1
-            if self.name=='RA' and (i==1 or i==2):
-                j = 0
-            if self.name=='RD' and i==0:
-                j = 2
-            if self.name=='RD' and i==2:
-                j = 1
-            try:
-                self.intf_L[j].put(p.to_byte_S(), 'out', True)
-            except:
-                j = 0
-                self.intf_L[j].put(p.to_byte_S(), 'out', True)
-            print('%s: forwarding packet "%s" from interface %d to %d' % \
-                (self, p, i, j))
+            self.intf_L[j].put(pkt_S, 'out', True)
+            if self.addr_D:
+                print('%s: forwarding packet "%s" from interface %d (%s) to %d (%s)' % \
+                    (self, pkt_S, i, self.addr_D.get(i), j, self.addr_D.get(j)))
+            else:
+                print('%s: forwarding packet "%s" from interface %d to %d' % \
+                    (self, pkt_S, i, j))
         except queue.Full:
-            print('%s: packet "%s" lost on interface %d' % (self, p, i))
+            print('%s: packet "%s" lost on interface %d' % (self, pkt_S, i))
             pass
 
 
-    ## send out route update
-    # @param i Interface number on which to send out a routing update
-    def send_routes(self, i):
-        # TODO: Send out a routing table update
-        #create a routing table update packet
-        if self.name=='RA':
-            
-            for j in range(len(self.rt_tbl_D)): # For all destinations
-                n=list(self.rt_tbl_D.keys())[j]
-                if (n==self.name):
-                    self.rt_tbl_D[n][self.name]=0
-                else:
-                    self.rt_tbl_D[n][self.name]=100
-                
-            for j in range(len(self.cost_D)): # For each neighbors
-                n=list(self.cost_D.keys())[j]
-                interface=list(self.cost_D[n].keys())[0]
-                self.rt_tbl_D[n][self.name]=self.cost_D[n][interface]
-                
-            for j in range(len(self.rt_tbl_D)): # For all destinations
-                n=list(self.rt_tbl_D.keys())[j]
-                p = NetworkPacket(self.rt_tbl_D[n][self.name], 'control', self.name)
-                try:
-                    print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-                    self.intf_L[i].put(p.to_byte_S(), 'out', True)
-                except queue.Full:
-                    print('%s: packet "%s" lost on interface %d' % (self, p, i))
-                    pass
-        elif self.name=='RB':           
-            for j in range(len(self.rt_tb2_D)): # For all destinations
-                n=list(self.rt_tb2_D.keys())[j]
-                if (n==self.name):
-                    self.rt_tb2_D[n][self.name]=0
-                else:
-                    self.rt_tb2_D[n][self.name]=100
-                
-            for j in range(len(self.cost_D)): # For each neighbors
-                n=list(self.cost_D.keys())[j]
-                interface=list(self.cost_D[n].keys())[0]
-                self.rt_tb2_D[n][self.name]=self.cost_D[n][interface]
-                
-            for j in range(len(self.rt_tbl_D)): # For all destinations
-                n=list(self.rt_tb2_D.keys())[j]
-                p = NetworkPacket(self.rt_tb2_D[n][self.name], 'control', self.name)
-                try:
-                    print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-                    self.intf_L[i].put(p.to_byte_S(), 'out', True)
-                except queue.Full:
-                    print('%s: packet "%s" lost on interface %d' % (self, p, i))
-                    pass
-        elif self.name=='RC':           
-            for j in range(len(self.rt_tb3_D)): # For all destinations
-                n=list(self.rt_tb3_D.keys())[j]
-                if (n==self.name):
-                    self.rt_tb3_D[n][self.name]=0
-                else:
-                    self.rt_tb3_D[n][self.name]=100
+    ## stable hash of the flow a packet belongs to, so that all packets of a flow
+    # take the same equal cost path and stay in order while different flows are
+    # spread over the paths. A flow is identified by its destination and source.
+    # The hash is seeded per router, so that routers one after the other on the
+    # paths of a flow choose among their equal cost paths independently.
+    #  @param pkt_S Byte string of the packet
+    def flow_hash(self, pkt_S):
+        return zlib.crc32((pkt_S[0 : NetworkPacket.dst_S_length] + NetworkPacket.peek_src(pkt_S)).encode(), self.flow_seed)
+    
+    
+    ## forward a multicast packet along the group's shared tree. The same packet
+    # string is put on every outgoing interface, nothing is copied or re-encoded.
+    #  @param pkt_S Byte string of the packet to forward
+    #  @param i Incoming interface number for packet pkt_S
+    #  @param group Group address as a 32 bit integer
+    #  @param snapshot RouteSnapshot the packet is forwarded with
+    def forward_multicast(self, pkt_S, i, group, snapshot):
+        tree_S = snapshot.mcast_D.get(group)
+        if tree_S is not None:
+            out_S = tree_S - {i}
+        else:
+            #off the tree, send toward the core where the packet joins the tree
+            j = snapshot.core_D.get(group)
+            out_S = {j} if j is not None and j != i else set()
+        if not out_S:
+            self.no_route_count += 1
+            print('%s: no tree for group %s, packet "%s" dropped' % (self, int_to_addr(group), pkt_S))
+        for j in sorted(out_S):
+            try:
+                self.intf_L[j].put(pkt_S, 'out', True)
+                print('%s: replicating packet "%s" for group %s from interface %d to %d' % \
+                    (self, pkt_S, int_to_addr(group), i, j))
+            except queue.Full:
+                print('%s: packet "%s" lost on interface %d' % (self, pkt_S, j))
                 
-            for j in range(len(self.cost_D)): # For each neighbors
-                n=list(self.cost_D.keys())[j]
-                interface=list(self.cost_D[n].keys())[0]
-                self.rt_tb3_D[n][self.name]=self.cost_D[n][interface]
                 
-            for j in range(len(self.rt_tb3_D)): # For all destinations
-                n=list(self.rt_tb3_D.keys())[j]
-                p = NetworkPacket(self.rt_tb3_D[n][self.name], 'control', self.name)
-                try:
-                    print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-                    self.intf_L[i].put(p.to_byte_S(), 'out', True)
-                except queue.Full:
-                    print('%s: packet "%s" lost on interface %d' % (self, p, i))
-                    pass
-        elif self.name=='RD':           
-            for j in range(len(self.rt_tb4_D)): # For all destinations
-                n=list(self.rt_tb4_D.keys())[j]
-                if (n==self.name):
-                    self.rt_tb4_D[n][self.name]=0
-                else:
-                    self.rt_tb4_D[n][self.name]=100
+    ## interface toward the core of a multicast group
+    #  @param group Group address as a 32 bit integer
+    #  @return interface number, or None at the core or if the core is unreachable
+    def core_intf(self, group):
+        core = self.mcast_core_D.get(group)
+        nbr = self.next_hop_D.get(core)
+        if core is None or core == self.name or nbr is None:
+            return None
+        return self.nbr_intf(nbr)
+    
+    
+    ## handle a multicast join or leave from a host or a downstream router
+    #  @param p Packet containing the JOIN:group or LEAVE:group message
+    #  @param i Interface number on which the packet arrived
+    def update_membership(self, p, i):
+        msg_S, group_S = p.data_S.split(':')
+        group = addr_to_int(group_S)
+        self.mcast_changed = True
+        if msg_S == 'JOIN':
+            if group not in self.downstream_D:
+                self.downstream_D[group] = set()
+                self.upstream_D[group] = None
+                self.graft(group)
+            self.downstream_D[group].add(i)
+        elif group in self.downstream_D:
+            self.downstream_D[group].discard(i)
+            if not self.downstream_D[group]:
+                #no members left behind us, prune ourselves from the tree
+                if self.upstream_D[group] is not None:
+                    self.send_membership(self.upstream_D[group], 'LEAVE', group)
+                del self.downstream_D[group]
+                del self.upstream_D[group]
                 
-            for j in range(len(self.cost_D)): # For each neighbors
-                n=list(self.cost_D.keys())[j]
-                interface=list(self.cost_D[n].keys())[0]
-                self.rt_tb4_D[n][self.name]=self.cost_D[n][interface]
                 
-            for j in range(len(self.rt_tb4_D)): # For all destinations
-                n=list(self.rt_tb4_D.keys())[j]
-                p = NetworkPacket(self.rt_tb4_D[n][self.name], 'control', self.name)
-                try:
-                    print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-                    self.intf_L[i].put(p.to_byte_S(), 'out', True)
-                except queue.Full:
-                    print('%s: packet "%s" lost on interface %d' % (self, p, i))
-                    pass
+    ## join the tree of a group toward its core, moving the join
+    # if the route to the core changed since
+    #  @param group Group address as a 32 bit integer
+    def graft(self, group):
+        if group not in self.upstream_D:
+            return #pruned meanwhile
+        j = self.core_intf(group)
+        if j == self.upstream_D[group]:
+            return
+        if self.upstream_D[group] is not None:
+            self.send_membership(self.upstream_D[group], 'LEAVE', group)
+        self.upstream_D[group] = j
+        self.mcast_changed = True
+        if j is not None:
+            self.send_membership(j, 'JOIN', group)
+            
+            
+    ## send a multicast join or leave
+    #  @param i Interface number on which to send the message
+    #  @param msg_S 'JOIN' or 'LEAVE'
+    #  @param group Group address as a 32 bit integer
+    def send_membership(self, i, msg_S, group):
+        p = self.pkt_pool.get(int_to_addr(group), 'control', '%s:%s' % (msg_S, int_to_addr(group)))
+        try:
+            print('%s: sending "%s" from interface %d' % (self, p, i))
+            self.intf_L[i].put(p.to_byte_S(), 'out', True)
+            self.ctrl_sent_count += 1
+            self.change_sent_count += 1
+        except queue.Full:
+            print('%s: packet "%s" lost on interface %d' % (self, p, i))
+        self.pkt_pool.release(p)
+            
 
+    ## send out route update
+    # @param i Interface number on which to send out a routing update
+    # @param split_horizon: overrides the router's split horizon setting if not None
+    # @param poisoned_reverse: overrides the router's poisoned reverse setting if not None
+    # @param dst_L: destinations to advertise, None for the whole table
+    # @param refresh: the routes are sent again unchanged, by a periodic update
+    def send_routes(self, i, split_horizon=None, poisoned_reverse=None, dst_L=None, refresh=False):
+        if split_horizon is None:
+            split_horizon = self.split_horizon
+        if poisoned_reverse is None:
+            poisoned_reverse = self.poisoned_reverse
+        if self.mode == 'ls':
+            self.send_lsdb(i)
+            return
+        nbr = self.intf_D[i]
+        entry_L = []
+        for dst in (list(self.rt_tbl_D) if dst_L is None else dst_L):
+            rtr_D = self.rt_tbl_D.get(dst)
+            if rtr_D is None:
+                continue #removed meanwhile
+            cost = rtr_D[self.name]
+            if nbr in (self.ecmp_D.get(dst) or [self.next_hop_D.get(dst)]) and dst != nbr: #one of the paths we use goes through it
+                if poisoned_reverse:
+                    cost = self.infinity
+                elif split_horizon:
+                    continue
+            entry_L.append('%s:%d' % (dst, cost))
+        #routing update packets of origin:dst:cost,dst:cost,... with up to routes_per_pkt entries each
+        for k in range(0, len(entry_L), self.routes_per_pkt):
+            p = self.pkt_pool.get(nbr, 'control', '%s:%s' % (self.name, ','.join(entry_L[k : k + self.routes_per_pkt])))
+            try:
+                print('%s: sending routing update "%s" from interface %d' % (self, p, i))
+                self.intf_L[i].put(p.to_byte_S(), 'out', True)
+                self.ctrl_sent_count += 1
+                if not refresh:
+                    self.change_sent_count += 1
+            except queue.Full:
+                print('%s: packet "%s" lost on interface %d' % (self, p, i))
+                pass
+            self.pkt_pool.release(p)
 
-    ## forward the packet according to the routing table
+
+    ## update the routing tables using the Bellman-Ford equation
     #  @param p Packet containing routing information
+    #  @param i Interface number on which the packet arrived
     def update_routes(self, p, i):
-        #TODO: add logic to update the routing tables and
-        # possibly send out routing updates
         print('%s: Received routing update %s from interface %d' % (self, p, i))
-        while True:
-            pkt_S = None
-            #get packet from interface i
-            pkt_S = self.intf_L[i].get('in')
-            #if packet exists make a forwarding decision
-            if pkt_S is not None:
-                for j in range(len(self.rt_tb2_D)):
-                   if (self.name=='RB'):
-                       self.rt_tbl_D['RB']['RA']=self.rt_tb2_D['RA']['RB']
-                       self.rt_tb3_D['RB']['RC']=self.rt_tb2_D['RC']['RB']
-                       self.rt_tb4_D['RB']['RD']=self.rt_tb2_D['RD']['RB']
-                       n=list(self.rt_tb2_D.keys())[j]
-                       x=self.rt_tb2_D[n]['RB']
-                       na, destiny= p.data_S[:len(p.data_S)//2], p.data_S[len(p.data_S)//2:]
-                       if(destiny==n):
-                           y1=int(p.dst)+self.rt_tb2_D[na][self.name]
-                           self.rt_tb2_D[n]['RB']=min(y1, self.rt_tb2_D[n]['RB'])
-                           
-                           if (x!=self.rt_tb2_D[n]['RB']):
-                               for j in range(len(self.rt_tb2_D)): # For all destinations
-                                   p = NetworkPacket(self.rt_tb2_D[n][self.name], 'control', self.name)
-                                   try:
-                                       print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-                                       self.intf_L[i].put(p.to_byte_S(), 'out', True)
-                                   except queue.Full:
-                                       print('%s: packet "%s" lost on interface %d' % (self, p, i))
-                                       pass
-
-                            
-                   elif (self.name=='RA'):
-                       self.rt_tb2_D['RA']['RB']=self.rt_tbl_D['RB']['RA']
-                       self.rt_tb3_D['RA']['RC']=self.rt_tbl_D['RC']['RA']
-                       self.rt_tb4_D['RA']['RD']=self.rt_tbl_D['RD']['RA']
-                       n=list(self.rt_tbl_D.keys())[j]
-                       x=self.rt_tbl_D[n]['RA']
-                       na, destiny= p.data_S[:len(p.data_S)//2], p.data_S[len(p.data_S)//2:]
-                       if(destiny==n):
-                           y1=int(p.dst)+self.rt_tbl_D[na][self.name]
-                           self.rt_tbl_D[n]['RA']=min(y1, self.rt_tbl_D[n]['RA'])
-                           if (x!=self.rt_tbl_D[n]['RA']):
-                               for j in range(len(self.rt_tbl_D)): # For all destinations
-                                    p = NetworkPacket(self.rt_tbl_D[n][self.name], 'control', self.name)
-                                    try:
-                                        print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-                                        self.intf_L[i].put(p.to_byte_S(), 'out', True)
-                                    except queue.Full:
-                                        print('%s: packet "%s" lost on interface %d' % (self, p, i))
-                                        pass
-                                
-                   elif (self.name=='RC'):
-                       self.rt_tb1_D['RC']['RA']=self.rt_tb3_D['RA']['RC']
-                       self.rt_tb2_D['RC']['RB']=self.rt_tb3_D['RB']['RC']
-                       self.rt_tb4_D['RC']['RD']=self.rt_tb3_D['RD']['RC']
-                       n=list(self.rt_tb3_D.keys())[j]
-                       x=self.rt_tb3_D[n]['RC']
-                       na, destiny= p.data_S[:len(p.data_S)//2], p.data_S[len(p.data_S)//2:]
-                       if(destiny==n):
-                           y1=int(p.dst)+self.rt_tb3_D[na][self.name]
-                           self.rt_tb3_D[n]['RC']=min(y1, self.rt_tb3_D[n]['RC'])
-                           if (x!=self.rt_tb3_D[n]['RC']):
-                               for j in range(len(self.rt_tb3_D)): # For all destinations
-                                    p = NetworkPacket(self.rt_tb3_D[n][self.name], 'control', self.name)
-                                    try:
-                                        print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-                                        self.intf_L[i].put(p.to_byte_S(), 'out', True)
-                                    except queue.Full:
-                                        print('%s: packet "%s" lost on interface %d' % (self, p, i))
-                                        pass
-                                
-                   elif (self.name=='RD'):
-                       self.rt_tb1_D['RD']['RA']=self.rt_tb3_D['RA']['RD']
-                       self.rt_tb2_D['RD']['RB']=self.rt_tb3_D['RB']['RD']
-                       self.rt_tb3_D['RD']['RC']=self.rt_tb3_D['RC']['RD']
-                       n=list(self.rt_tb4_D.keys())[j]
-                       x=self.rt_tb4_D[n]['RD']
-                       na, destiny= p.data_S[:len(p.data_S)//2], p.data_S[len(p.data_S)//2:]
-                       if(destiny==n):
-                           y1=int(p.dst)+self.rt_tb4_D[na][self.name]
-                           self.rt_tb4_D[n]['RD']=min(y1, self.rt_tb4_D[n]['RD'])
-                           if (x!=self.rt_tb4_D[n]['RD']):
-                               for j in range(len(self.rt_tb4_D)): # For all destinations
-                                    p = NetworkPacket(self.rt_tb4_D[n][self.name], 'control', self.name)
-                                    try:
-                                        print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-                                        self.intf_L[i].put(p.to_byte_S(), 'out', True)
-                                    except queue.Full:
-                                        print('%s: packet "%s" lost on interface %d' % (self, p, i))
-                                        pass
-
-
+        if p.data_S.startswith(('JOIN:', 'LEAVE:')):
+            self.update_membership(p, i)
+            return
+        if self.mode == 'ls':
+            self.update_link_state(p, i)
+            return
+        origin, entry_S = p.data_S.split(':', 1)
+        first_heard = origin not in self.rt_tbl_D[origin]
+        self.rt_tbl_D[origin][origin] = 0
+        changed_S = set()
+        for entry in entry_S.split(','):
+            dst, cost = entry.rsplit(':', 1)
+            self.add_destination(dst)[origin] = min(int(cost), self.infinity)
+            self.adv_D[origin].add(dst)
+            if self.wheel is not None and dst != origin:
+                self.refresh_expiry((dst, origin))
+            if self.update_route_via(dst, origin):
+                changed_S.add(dst)
+        #a newly heard neighbor has not seen our table yet
+        if first_heard:
+            self.send_routes(self.nbr_intf(origin))
+        if changed_S:
+            self.trigger_update(changed_S)
+                
+                
+    ## send out route updates on all interfaces
+    #  @param dst_L Destinations to advertise, None for the whole table
+    #  @param refresh The routes are sent again unchanged, by a periodic update
+    def advertise(self, dst_L=None, refresh=False):
+        for j in range(len(self.intf_L)):
+            self.send_routes(j, dst_L=dst_L, refresh=refresh)
+        for dst in (list(self.rt_tbl_D) if dst_L is None else dst_L):
+            if dst in self.rt_tbl_D:
+                self.adv_cost_D[dst] = self.rt_tbl_D[dst][self.name]
+            
+            
+    ## advertise changed routes. Changes arriving within trigger_delay of each
+    # other go out together in one update per neighbor. A destination that was
+    # just advertised is held down for holddown_time before it is advertised
+    # again, and one that keeps going between reachable and unreachable is
+    # suppressed from triggered updates until it settles (flap damping),
+    # periodic updates still carry it. Bad news, a withdrawal or a higher cost,
+    # is never held down or suppressed, as it is what ends counting to infinity.
+    # Without protocol timers the changes are sent right away.
+    #  @param dst_S Destinations whose routes changed
+    def trigger_update(self, dst_S):
+        if self.wheel is None:
+            self.advertise(sorted(dst_S))
+            return
+        now = self.clock()
+        for dst in dst_S:
+            reachable = self.rt_tbl_D.get(dst, {}).get(self.name, self.infinity) < self.infinity
+            if self.reachable_D.get(dst, reachable) != reachable:
+                self.penalty_D[dst] = (self.flap_penalty_of(dst, now) + \
+                    (self.flap_penalty if reachable else self.flap_withdraw_penalty), now)
+            self.reachable_D[dst] = reachable
+        self.pending_S |= dst_S
+        if self.trigger_timer is None:
+            self.trigger_timer = self.wheel.schedule(self.trigger_delay, self.post, self.send_triggered)
+            
+            
+    ## current flap penalty of a destination
+    #  @param dst Destination
+    #  @param now Current time
+    def flap_penalty_of(self, dst, now):
+        penalty, since = self.penalty_D.get(dst, (0, now))
+        penalty *= 0.5 ** ((now - since) / self.flap_half_life)
+        if penalty < 1:
+            self.penalty_D.pop(dst, None)
+            return 0
+        return penalty
+    
+    
+    ## timer callback sending the coalesced triggered update
+    def send_triggered(self):
+        self.trigger_timer = None
+        if self.stop:
+            return
+        now = self.clock()
+        dst_L = []
+        held_until = None
+        for dst in sorted(self.pending_S):
+            cost = self.rt_tbl_D.get(dst, {}).get(self.name, self.infinity)
+            if cost >= self.infinity or cost > self.adv_cost_D.get(dst, cost):
+                dst_L.append(dst) #bad news goes out right away
+                self.pending_S.discard(dst)
+                self.held_D[dst] = now + self.holddown_time
+                continue
+            penalty = self.flap_penalty_of(dst, now)
+            if penalty >= self.flap_suppress or (dst in self.suppressed_S and penalty >= self.flap_reuse):
+                if dst not in self.suppressed_S:
+                    print('%s: route to %s is flapping, suppressing triggered updates' % (self, dst))
+                self.suppressed_S.add(dst)
+                self.pending_S.discard(dst)
+                continue
+            self.suppressed_S.discard(dst)
+            if self.held_D.get(dst, now) > now:
+                held_until = min(held_until or self.held_D[dst], self.held_D[dst])
+                continue
+            dst_L.append(dst)
+            self.pending_S.discard(dst)
+            self.held_D[dst] = now + self.holddown_time
+        if dst_L:
+            self.advertise(dst_L)
+        if held_until is not None:
+            self.trigger_timer = self.wheel.schedule(held_until - now, self.post, self.send_triggered)
+            
+            
+    ## change the cost of the link on an interface, done by the control plane
+    #  @param i Interface number of the link
+    #  @param cost New cost of the link
+    def set_link_cost(self, i, cost):
+        self.post(self.apply_link_cost, i, cost)
+        
+        
+    ## take down the link on an interface, done by the control plane
+    #  @param i Interface number of the link
+    def link_down(self, i):
+        self.post(self.apply_link_down, i)
+        
+        
+    ## bring back up a link taken down with link_down(), done by the control plane
+    #  @param i Interface number of the link
+    def link_up(self, i):
+        self.post(self.apply_link_up, i)
+        
+        
+    ## change the cost of the link on an interface and reconverge. The cost of
+    # a link that is down takes effect when it is brought back up.
+    #  @param i Interface number of the link
+    #  @param cost New cost of the link
+    def apply_link_cost(self, i, cost):
+        nbr = self.intf_D[i]
+        if i in self.down_cost_D:
+            self.down_cost_D[i] = cost
+            print('%s: cost of failed link to %s on interface %d changed to %d' % (self, nbr, i, cost))
+            return
+        old_cost = self.cost_D[nbr][i]
+        self.cost_D[nbr][i] = cost
+        print('%s: cost of link to %s on interface %d changed to %d' % (self, nbr, i, cost))
+        if self.mode == 'ls':
+            self.originate_lsa()
+            self.compute_shortest_paths()
+            self.publish()
+            return
+        #a cheaper link may improve anything the neighbor advertised,
+        # a dearer one only what currently goes through it
+        dst_S = self.dep_D[nbr] | {nbr} | {prefix for prefix, conn_nbr in self.conn_D.items() if conn_nbr == nbr}
+        if cost < old_cost:
+            dst_S = dst_S | self.adv_D[nbr]
+        changed_S = {dst for dst in sorted(dst_S) if self.update_route_via(dst, nbr)} #in a fixed order, so that runs are reproducible
+        self.publish()
+        if changed_S:
+            self.trigger_update(changed_S)
+            
+            
+    ## take down the link on an interface, its cost is restored by apply_link_up()
+    #  @param i Interface number of the link
+    def apply_link_down(self, i):
+        if i in self.down_cost_D:
+            return
+        cost = self.cost_D[self.intf_D[i]][i]
+        self.apply_link_cost(i, self.infinity)
+        self.down_cost_D[i] = cost
+        
+        
+    ## bring back up a link taken down with apply_link_down()
+    #  @param i Interface number of the link
+    def apply_link_up(self, i):
+        if i in self.down_cost_D:
+            self.apply_link_cost(i, self.down_cost_D.pop(i))
+            #the neighbor may have dropped our routes while the link was down
+            self.send_routes(i)
+                
+                
+    ## start periodic route advertisements, route expiry and garbage collection
+    #  @param wheel TimerWheel shared by all routers
+    #  @param update_interval Seconds between periodic advertisements
+    #  @param jitter Fraction of update_interval by which each advertisement is randomly moved
+    #  @param route_timeout Seconds after which a route that was not advertised again expires
+    #  @param gc_time Seconds an expired route is kept (advertised as unreachable) before it is removed
+    #  @param trigger_delay Seconds over which route changes are collected into one triggered update
+    #  @param holddown_time Seconds before a route in a triggered update is advertised again
+    #  @param flap_half_life Seconds in which the flap penalty of a route halves
+    def start_timers(self, wheel, update_interval=30, jitter=0.2, route_timeout=180, gc_time=120,
+                     trigger_delay=0.05, holddown_time=0.5, flap_half_life=15):
+        self.wheel = wheel
+        self.update_interval = update_interval
+        self.jitter = jitter
+        self.route_timeout = route_timeout
+        self.gc_time = gc_time
+        self.trigger_delay = trigger_delay
+        self.holddown_time = holddown_time
+        self.flap_half_life = flap_half_life
+        self.schedule_update()
+        
+        
+    ## schedule the next periodic advertisement
+    def schedule_update(self):
+        delay = self.update_interval * (1 + self.rng.uniform(-self.jitter, self.jitter))
+        self.wheel.schedule(delay, self.post, self.periodic_update)
+        
+        
+    ## timer callback for periodic advertisements
+    def periodic_update(self):
+        if self.stop:
+            return
+        if self.mode == 'ls':
+            self.originate_lsa()
+        else:
+            self.advertise(refresh=True)
+            self.pending_S.clear() #the full table went out, covering pending triggered updates
+        #follow route changes toward multicast cores
+        for group in list(self.upstream_D):
+            self.graft(group)
+        self.publish()
+        self.schedule_update()
+        
+        
+    ## restart the expiry timer of a route or link state advertisement
+    #  @param key (destination, neighbor) of a learned route or origin of an advertisement
+    def refresh_expiry(self, key):
+        timer = self.expiry_D.get(key)
+        if timer is not None:
+            timer.cancel()
+        self.expiry_D[key] = self.wheel.schedule(self.route_timeout, self.post, self.expire_route, key)
+        
+        
+    ## timer callback for a route or link state advertisement that was not refreshed
+    #  @param key (destination, neighbor) of a learned route or origin of an advertisement
+    def expire_route(self, key):
+        timer = self.expiry_D.get(key)
+        if timer is not None and timer.expires > self.wheel.tick:
+            return #refreshed while the expiry waited for the control plane
+        self.expiry_D.pop(key, None)
+        if self.mode == 'ls':
+            print('%s: link state advertisement from %s expired' % (self, key))
+            self.lsdb_D.pop(key, None)
+            self.compute_shortest_paths()
+            self.publish()
+            return
+        dst, nbr = key
+        print('%s: route to %s through %s expired' % (self, dst, nbr))
+        self.rt_tbl_D[dst][nbr] = self.infinity
+        changed = self.update_route_via(dst, nbr)
+        self.publish()
+        if changed:
+            self.trigger_update({dst})
+        self.wheel.schedule(self.gc_time, self.post, self.collect_route, dst, nbr)
+        
+        
+    ## timer callback removing an expired route that was not learned again
+    #  @param dst Destination of the route
+    #  @param nbr Neighbor the route was learned from
+    def collect_route(self, dst, nbr):
+        if (dst, nbr) in self.expiry_D or dst not in self.rt_tbl_D:
+            return #learned again
+        self.rt_tbl_D[dst].pop(nbr, None)
+        self.adv_D[nbr].discard(dst)
+        if self.next_hop_D.get(dst) is None and dst not in self.cost_D and len(self.rt_tbl_D[dst]) == 1:
+            print('%s: removing unreachable destination %s' % (self, dst))
+            self.remove_destination(dst)
+            self.publish()
+            
+            
+    ## originate a new advertisement of our links and flood it
+    def originate_lsa(self):
+        seq, old_cost_D = self.lsdb_D[self.name]
+        self.lsdb_D[self.name] = (seq + 1, self.lsa_costs())
+        for j in range(len(self.intf_L)):
+            self.send_lsa(j, self.name, self.lsdb_D[self.name][1] == old_cost_D)
+        
+        
+    ## send a link state advertisement
+    #  @param i Interface number on which to send the advertisement
+    #  @param origin Router whose advertisement from the database is sent
+    #  @param refresh The advertisement only refreshes an unchanged one
+    def send_lsa(self, i, origin, refresh=False):
+        seq, cost_D = self.lsdb_D[origin]
+        costs_S = ','.join('%s=%d' % (nbr, cost) for nbr, cost in cost_D.items())
+        p = self.pkt_pool.get(self.intf_D[i], 'control', 'LSA:%s:%d:%s' % (origin, seq, costs_S))
+        try:
+            print('%s: sending link state advertisement "%s" from interface %d' % (self, p, i))
+            self.intf_L[i].put(p.to_byte_S(), 'out', True)
+            self.ctrl_sent_count += 1
+            if not refresh:
+                self.change_sent_count += 1
+        except queue.Full:
+            print('%s: packet "%s" lost on interface %d' % (self, p, i))
+            pass
+        self.pkt_pool.release(p)
+            
+            
+    ## send the whole link state database to a neighbor
+    #  @param i Interface number on which to send the database
+    def send_lsdb(self, i):
+        self.synced_S.add(i)
+        for origin in list(self.lsdb_D):
+            self.send_lsa(i, origin)
+            
+            
+    ## store a link state advertisement, flood it if it is new and recompute paths
+    #  @param p Packet containing the advertisement
+    #  @param i Interface number on which the packet arrived
+    def update_link_state(self, p, i):
+        _, origin, seq, costs_S = p.data_S.split(':')
+        seq = int(seq)
+        #a newly heard neighbor needs our database
+        if i not in self.synced_S:
+            self.send_lsdb(i)
+        if origin in self.lsdb_D and self.lsdb_D[origin][0] >= seq:
+            return
+        cost_D = {}
+        for entry_S in costs_S.split(','):
+            if entry_S:
+                nbr, cost = entry_S.split('=')
+                cost_D[nbr] = int(cost)
+        refresh = origin in self.lsdb_D and self.lsdb_D[origin][1] == cost_D
+        self.lsdb_D[origin] = (seq, cost_D)
+        if self.wheel is not None and origin != self.name:
+            self.refresh_expiry(origin)
+        for j in range(len(self.intf_L)):
+            if j != i:
+                self.send_lsa(j, origin, refresh)
+        self.compute_shortest_paths()
+        
+        
+    ## run Dijkstra's algorithm over the link state database and
+    # update our routes and next hops
+    def compute_shortest_paths(self):
+        dist_D = {self.name: 0}
+        first_hop_D = {self.name: [self.name]} #all first hops of equal cost paths
+        done_S = set()
+        heap_L = [(0, self.name)]
+        while heap_L:
+            dist, node = heapq.heappop(heap_L)
+            if node in done_S:
+                continue
+            done_S.add(node)
+            if node not in self.lsdb_D: #hosts do not forward
+                continue
+            for nbr, cost in self.lsdb_D[node][1].items():
+                if cost >= self.infinity:
+                    continue
+                nbr_dist = dist + cost
+                hop_L = [self.conn_D.get(nbr, nbr)] if node == self.name else first_hop_D[node]
+                if nbr_dist < dist_D.get(nbr, self.infinity):
+                    dist_D[nbr] = nbr_dist
+                    first_hop_D[nbr] = list(hop_L)
+                    heapq.heappush(heap_L, (nbr_dist, nbr))
+                elif nbr_dist == dist_D.get(nbr):
+                    first_hop_D[nbr] = first_hop_D[nbr] + [hop for hop in hop_L if hop not in first_hop_D[nbr]]
+        changed = False
+        for dst in set(self.rt_tbl_D) | set(dist_D):
+            cost = dist_D.get(dst, self.infinity)
+            hop_L = sorted(first_hop_D.get(dst, [None]), key=str)
+            nbr = hop_L[0]
+            if (self.ecmp_D.get(dst) or [nbr]) != hop_L:
+                self.changed_S.add(dst)
+            if len(hop_L) > 1:
+                self.ecmp_D[dst] = hop_L
             else:
+                self.ecmp_D.pop(dst, None)
+            if self.add_destination(dst).get(self.name) != cost or self.next_hop_D.get(dst) != nbr:
+                self.rt_tbl_D[dst][self.name] = cost
+                self.next_hop_D[dst] = nbr
+                self.changed_S.add(dst)
+                changed = True
+        if changed:
+            self.last_change_time = self.clock()
+        return changed
+                
+                
+    ## cost of the path to a destination through a neighbor
+    #  @param dst Destination
+    #  @param nbr Neighbor
+    def route_via(self, dst, nbr):
+        if nbr == dst or self.conn_D.get(dst) == nbr:
+            return self.link_cost(nbr)
+        return min(self.link_cost(nbr) + self.rt_tbl_D[dst].get(nbr, self.infinity), self.infinity)
+    
+    
+    ## install the best and second best paths to a destination
+    #  @param dst Destination
+    #  @param best (cost, neighbor) of the best path
+    #  @param second (cost, neighbor) of the second best path
+    #  @return True if our cost, next hop or equal cost next hops to dst changed
+    def set_paths(self, dst, best, second):
+        old_cost = self.rt_tbl_D[dst].get(self.name)
+        old_nbr = self.next_hop_D.get(dst)
+        old_second = self.second_D.get(dst, (self.infinity, None))
+        old_ecmp_L = self.ecmp_D.get(dst)
+        for nbr in [old_nbr, old_second[1]] + self.ecmp_D.get(dst, []):
+            if nbr in self.dep_D:
+                self.dep_D[nbr].discard(dst)
+        if best[0] >= self.infinity:
+            best = (self.infinity, None)
+        self.rt_tbl_D[dst][self.name], self.next_hop_D[dst] = best
+        self.second_D[dst] = second
+        #a tie between the two best paths means there may be more equal cost next hops
+        if best[1] is not None and second[0] == best[0]:
+            self.ecmp_D[dst] = [nbr for nbr in self.cost_D if self.route_via(dst, nbr) == best[0]]
+        else:
+            self.ecmp_D.pop(dst, None)
+        for nbr in [best[1], second[1]] + self.ecmp_D.get(dst, []):
+            if nbr is not None:
+                self.dep_D[nbr].add(dst)
+        #a neighbor joining the tie must hear the route poisoned, so that changes too
+        if old_cost != best[0] or old_nbr != best[1] or self.ecmp_D.get(dst) != old_ecmp_L:
+            self.changed_S.add(dst)
+            self.last_change_time = self.clock()
+            return True
+        return False
+    
+    
+    ## update the paths to a destination after the cost through one neighbor changed,
+    # only falling back to a scan of all neighbors when both best paths got worse
+    #  @param dst Destination to update
+    #  @param nbr Neighbor whose cost to dst changed
+    #  @return True if our cost, next hop or equal cost next hops to dst changed
+    def update_route_via(self, dst, nbr):
+        if dst == self.name:
+            return False
+        if self.next_hop_D.get(dst) is None and dst not in self.second_D:
+            return self.recompute_route(dst)
+        cost = self.route_via(dst, nbr)
+        best = (self.rt_tbl_D[dst][self.name], self.next_hop_D[dst])
+        second = self.second_D[dst]
+        if nbr != best[1] and nbr != second[1] and ((cost == best[0] and cost < self.infinity) or nbr in self.ecmp_D.get(dst, ())):
+            return self.recompute_route(dst) #joins or leaves a tie for the best path
+        if nbr == best[1]:
+            if cost <= second[0]:
+                return self.set_paths(dst, (cost, nbr), second)
+            return self.recompute_route(dst)
+        if cost < best[0]:
+            return self.set_paths(dst, (cost, nbr), best)
+        if nbr == second[1]:
+            if cost <= second[0]:
+                return self.set_paths(dst, best, (cost, nbr))
+            return self.recompute_route(dst)
+        if cost < second[0]:
+            return self.set_paths(dst, best, (cost, nbr))
+        return False
+    
+    
+    ## recompute the least cost path to a destination by scanning all neighbors
+    #  @param dst Destination to recompute
+    #  @return True if our cost, next hop or equal cost next hops to dst changed
+    def recompute_route(self, dst):
+        if dst == self.name:
+            return False
+        best = second = (self.infinity, None)
+        for nbr in self.cost_D:
+            cost = self.route_via(dst, nbr)
+            if cost < best[0]:
+                best, second = (cost, nbr), best
+            elif cost < second[0]:
+                second = (cost, nbr)
+        return self.set_paths(dst, best, second)
+    
+    
+    ## outgoing interfaces of the route to a destination, for the forwarding snapshot
+    #  @param dst Destination
+    #  @return tuple of interfaces, several for equal cost paths, None if there is no route
+    def route_entry(self, dst):
+        nbr = self.next_hop_D.get(dst)
+        if nbr is None or nbr == self.name or self.rt_tbl_D.get(dst, {}).get(self.name, self.infinity) >= self.infinity:
+            return None
+        return tuple(self.nbr_intf(nbr) for nbr in self.ecmp_D.get(dst) or [nbr])
+    
+    
+    ## publish a new forwarding snapshot if routes or multicast trees changed.
+    # Only changed routes are looked up again, the rest are copied from the
+    # current snapshot, and the prefix trie is only rebuilt when the set of
+    # reachable prefixes changed.
+    def publish(self):
+        with self.publish_lock:
+            if not self.changed_S and not self.mcast_changed:
                 return
-        
+            old = self.snapshot
+            changed_S, self.changed_S = self.changed_S, set()
+            self.mcast_changed = False
+            route_D = dict(old.route_D)
+            fib_changed = False
+            for dst in changed_S:
+                entry = self.route_entry(dst)
+                if '/' in dst and (entry is None) != (dst not in route_D):
+                    fib_changed = True
+                if entry is None:
+                    route_D.pop(dst, None)
+                else:
+                    route_D[dst] = entry
+            fib = old.fib
+            if fib_changed:
+                fib = PrefixTrie()
+                for dst in route_D:
+                    if '/' in dst:
+                        key, length = parse_prefix(dst)
+                        fib.insert(key, length, dst)
+            mcast_D = {group: frozenset(down_S | {self.upstream_D.get(group)} - {None})
+                       for group, down_S in list(self.downstream_D.items())}
+            core_D = {group: self.core_intf(group) for group in self.mcast_core_D}
+            self.snapshot = RouteSnapshot(old.version + 1, route_D, fib, mcast_D, core_D)
 
                 
     ## thread target for the host to keep forwarding data
     def run(self):
         print (threading.currentThread().getName() + ': Starting')
+        #this thread is the control plane, data plane worker k owns every k-th interface
+        worker_L = [threading.Thread(name='%s data plane %d' % (self, k), target=self.forwarding_worker,
+                                     args=(range(k, len(self.intf_L), self.forwarding_workers),))
+                    for k in range(self.forwarding_workers)]
+        for worker in worker_L:
+            worker.start()
         while True:
-            self.process_queues()
+            if worker_L:
+                self.process_control()
+            else:
+                self.process_queues()
             if self.stop:
+                for worker in worker_L:
+                    worker.join()
                 print (threading.currentThread().getName() + ': Ending')
                 return 
@@ -0,0 +1,148 @@
+import array
+import sys
+import threading
+import time
+
+
+## Opt-in timing hooks around the main loops of routers, hosts and links.
+# attach() replaces the hooked methods on each instance with a timed wrapper
+# and detach() removes the wrappers again, so nodes that are not attached
+# run their original methods with no extra work at all.
+class HookProfiler:
+
+    ## functions hooked on each kind of node, and the slot counting calls whose falsy
+    # return means the node was idle, None for functions that are not loops.
+    # Routers with forwarding workers loop in their data and control planes,
+    # routers without them in process_queues
+    router_hook_L = [('process_queues', 'idle'), ('forward_packet', None), ('update_routes', None)]
+    router_planes_hook_L = [('forward_queues', 'data_idle'), ('process_control', 'control_idle'),
+                            ('forward_packet', None), ('update_routes', None)]
+    host_hook_L = [('udt_receive', 'idle')]
+    link_hook_L = [('tx_pkt', 'idle')]
+
+    ## @param capacity - number of per-call times kept for each hooked function
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.name_L = []            # slot number -> 'node.function'
+        self.count_A = array.array('Q')  # calls per slot
+        self.total_A = array.array('Q')  # total ns per slot
+        self.sample_L = []          # per slot ring of the last capacity call times in ns
+        self.hooked_L = []          # (object, method name) to restore on detach
+
+    ## allocate the counters of one slot
+    def new_slot(self, name_S):
+        self.name_L.append(name_S)
+        self.count_A.append(0)
+        self.total_A.append(0)
+        self.sample_L.append(array.array('Q', bytes(8 * self.capacity)))
+        return len(self.name_L) - 1
+
+    ## replace a method of one object with a timed wrapper
+    # @param obj: router, host or link
+    # @param name_S: name of the method
+    # @param idle_S: name of the slot where calls returning a falsy value are also counted as idle time, None for none
+    def hook(self, obj, name_S, idle_S):
+        func = getattr(obj, name_S)
+        slot = self.new_slot('%s.%s' % (obj, name_S))
+        idle_slot = self.new_slot('%s.%s' % (obj, idle_S)) if idle_S else None
+        count_A, total_A, capacity = self.count_A, self.total_A, self.capacity
+        sample_A = self.sample_L[slot]
+        clock = time.perf_counter_ns
+        def timed(*args):
+            start = clock()
+            result = func(*args)
+            elapsed = clock() - start
+            n = count_A[slot]
+            sample_A[n % capacity] = elapsed
+            count_A[slot] = n + 1
+            total_A[slot] += elapsed
+            if idle_slot is not None and not result:
+                count_A[idle_slot] += 1
+                total_A[idle_slot] += elapsed
+            return result
+        setattr(obj, name_S, timed)
+        self.hooked_L.append((obj, name_S))
+
+    ## hook the loops of the given objects
+    # @param obj_L: routers, hosts and link layers, as in the simulation's object list
+    def attach(self, obj_L):
+        for obj in obj_L:
+            if hasattr(obj, 'forward_packet'):
+                hook_L = [(obj, self.router_planes_hook_L if obj.forwarding_workers else self.router_hook_L)]
+            elif hasattr(obj, 'udt_receive'):
+                hook_L = [(obj, self.host_hook_L)]
+            elif hasattr(obj, 'link_L'):
+                hook_L = [(link, self.link_hook_L) for link in obj.link_L]
+            else:
+                continue
+            for (node, name_L) in hook_L:
+                for (name_S, idle_S) in name_L:
+                    self.hook(node, name_S, idle_S)
+
+    ## remove all hooks, the objects go back to their class methods
+    def detach(self):
+        for (obj, name_S) in self.hooked_L:
+            delattr(obj, name_S)
+        self.hooked_L = []
+
+    ## per slot call counts and timings as a printable table
+    def report(self):
+        line_L = ['%-36s %10s %12s %10s %10s' % ('function', 'calls', 'total ms', 'mean us', 'p99 us')]
+        for slot, name_S in enumerate(self.name_L):
+            n = self.count_A[slot]
+            if n == 0:
+                continue
+            kept_L = sorted(self.sample_L[slot][:min(n, self.capacity)])
+            p99 = kept_L[min(len(kept_L) - 1, int(len(kept_L) * 0.99))] if not name_S.endswith('idle') else 0
+            line_L.append('%-36s %10d %12.3f %10.3f %10.3f' % \
+                (name_S, n, self.total_A[slot] / 1e6, self.total_A[slot] / n / 1e3, p99 / 1e3))
+        return '\n'.join(line_L)
+
+
+## Samples the stacks of all simulation threads at a fixed interval and writes
+# them in the collapsed format read by flame graph tools (one 'frame;frame count' per line)
+class SamplingProfiler:
+
+    ## @param interval - seconds between samples
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stack_D = {} # {collapsed stack: samples}
+        self.stop = False #for thread termination
+
+    ## called when printing the object
+    def __str__(self):
+        return 'SamplingProfiler'
+
+    ## record the current stack of every other thread
+    def sample(self):
+        name_D = {t.ident: t.name for t in threading.enumerate()}
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            frame_L = []
+            while frame is not None:
+                code = frame.f_code
+                frame_L.append('%s (%s:%d)' % (code.co_name, code.co_filename.split('/')[-1], code.co_firstlineno))
+                frame = frame.f_back
+            frame_L.append(name_D.get(ident, str(ident)))
+            stack_S = ';'.join(reversed(frame_L))
+            self.stack_D[stack_S] = self.stack_D.get(stack_S, 0) + 1
+
+    ## write the samples in collapsed stack format
+    # @param path_S: output file
+    def write_collapsed(self, path_S):
+        with open(path_S, 'w') as f:
+            for stack_S, count in sorted(self.stack_D.items()):
+                f.write('%s %d\n' % (stack_S, count))
+
+    ## thread target for the profiler to keep sampling
+    def run(self):
+        print (threading.currentThread().getName() + ': Starting')
+        while True:
+            self.sample()
+            time.sleep(self.interval)
+            if self.stop:
+                print (threading.currentThread().getName() + ': Ending')
+                return
+
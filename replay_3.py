@@ -0,0 +1,98 @@
+import json
+import time
+
+
+## Records host sends, group membership and link events of a simulation run,
+# one JSON list [seconds since start, event, arguments...] per line.
+# attach() wraps the methods on each instance, like the profiling hooks.
+class EventRecorder:
+
+    ## methods recorded on hosts and on the link layer
+    host_event_L = ['udt_send', 'join', 'leave']
+    link_layer_event_L = ['change_link_cost', 'fail_link', 'restore_link']
+
+    ## @param path_S - event trace written by close()
+    def __init__(self, path_S):
+        self.path_S = path_S
+        self.event_L = []
+        self.hooked_L = [] # (object, method name) to restore on close
+        self.clock = time.monotonic #replaced by a virtual clock when run deterministically
+        self.start = self.clock()
+
+    ## wrap a method so that each call is recorded before it runs
+    # @param obj: host or link layer
+    # @param name_S: name of the method
+    # @param encode: turns the call arguments into JSON serializable values
+    def hook(self, obj, name_S, encode):
+        func = getattr(obj, name_S)
+        event_L, start, clock = self.event_L, self.start, self.clock
+        def recorded(*args):
+            event_L.append([round(clock() - start, 6), name_S] + encode(*args))
+            return func(*args)
+        setattr(obj, name_S, recorded)
+        self.hooked_L.append((obj, name_S))
+
+    ## record the events of the given objects, the clock starts now
+    # @param obj_L: simulation objects, as in the simulation's object list
+    def attach(self, obj_L):
+        self.start = self.clock()
+        for obj in obj_L:
+            if hasattr(obj, 'udt_send'):
+                for name_S in self.host_event_L:
+                    self.hook(obj, name_S, lambda *args, host=obj: [str(host)] + list(args))
+            elif hasattr(obj, 'link_L'):
+                #links are recorded by their position in the link layer
+                for name_S in self.link_layer_event_L:
+                    self.hook(obj, name_S, lambda link, *args, layer=obj: [layer.link_L.index(link)] + list(args))
+
+    ## stop recording and write the event trace
+    def close(self):
+        for (obj, name_S) in self.hooked_L:
+            delattr(obj, name_S)
+        self.hooked_L = []
+        with open(self.path_S, 'w') as f:
+            for event in self.event_L:
+                f.write(json.dumps(event) + '\n')
+        print('Recorded %d events to %s' % (len(self.event_L), self.path_S))
+
+
+## Replays an event trace written by EventRecorder through the same topology
+class EventReplayer:
+
+    ## @param path_S - event trace to replay
+    # @param obj_L - simulation objects, hosts are found by name and links by position
+    # @param speed - 1 replays at the recorded pace, 2 twice as fast, 0 as fast as possible
+    def __init__(self, path_S, obj_L, speed=1.0):
+        with open(path_S) as f:
+            self.event_L = [json.loads(line) for line in f if line.strip()]
+        self.host_D = {str(obj): obj for obj in obj_L if hasattr(obj, 'udt_send')}
+        self.link_layer = next(obj for obj in obj_L if hasattr(obj, 'link_L'))
+        self.speed = speed
+        ## clock and sleep, replaced by virtual time when run deterministically
+        self.clock = time.monotonic
+        self.sleep = time.sleep
+
+    ## issue one recorded event
+    def apply(self, event):
+        name_S, arg_L = event[1], event[2:]
+        if name_S in EventRecorder.host_event_L:
+            getattr(self.host_D[arg_L[0]], name_S)(*arg_L[1:])
+        elif name_S in EventRecorder.link_layer_event_L:
+            link = self.link_layer.link_L[arg_L[0]]
+            getattr(self.link_layer, name_S)(link, *arg_L[1:])
+        else:
+            raise Exception('Unknown event %s in event trace' % name_S)
+
+    ## replay all events, waiting between them unless running at maximum speed
+    # @return seconds the replay took
+    def replay(self):
+        start = self.clock()
+        for event in self.event_L:
+            if self.speed > 0:
+                delay = start + event[0] / self.speed - self.clock()
+                if delay > 0:
+                    self.sleep(delay)
+            self.apply(event)
+        elapsed = self.clock() - start
+        print('Replayed %d events in %.3f s' % (len(self.event_L), elapsed))
+        return elapsed
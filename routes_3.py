@@ -0,0 +1,53 @@
+import csv
+
+
+## routing tables of many routers rendered into one string
+# @param router_L: routers to dump
+# @param changed_only: only show destinations that changed since the last changed_only dump
+def format_all_routes(router_L, changed_only=False):
+    return '\n'.join([table_S for table_S in (router.format_routes(changed_only) for router in router_L) if table_S])
+
+
+## rows of (router, destination, cost, next hop) over all routers, in router then destination order,
+# the next hop is '' for unreachable destinations
+def route_rows(router_L):
+    for router in router_L:
+        next_hop_D = router.next_hop_D
+        for dst in sorted(router.rt_tbl_D):
+            yield (router.name, dst, router.rt_tbl_D[dst].get(router.name, router.infinity), next_hop_D.get(dst) or '')
+
+
+## write the routing tables of all routers to a CSV file with a row per router and destination
+# @param router_L: routers to export
+# @param path_S: output file
+def write_csv(router_L, path_S):
+    with open(path_S, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['router', 'destination', 'cost', 'next_hop'])
+        writer.writerows(route_rows(router_L))
+
+
+## write the routing tables of all routers to a NumPy .npz file holding
+# 'routers' and 'destinations' name arrays, a 'cost' matrix indexed
+# [router, destination] with the router's infinity for unknown destinations,
+# and a matching 'next_hop' matrix of neighbor names ('' for none)
+# @param router_L: routers to export
+# @param path_S: output file
+def write_npz(router_L, path_S):
+    try:
+        import numpy
+    except ImportError:
+        raise Exception('NumPy is needed to export routing tables to %s' % path_S)
+    rtr_L = [router.name for router in router_L]
+    dst_L = sorted({dst for router in router_L for dst in router.rt_tbl_D})
+    dst_idx_D = {dst: j for j, dst in enumerate(dst_L)}
+    cost_A = numpy.empty((len(rtr_L), len(dst_L)), dtype=numpy.int32)
+    next_hop_A = numpy.full((len(rtr_L), len(dst_L)), '', dtype='U%d' % max([1] + [len(rtr) for rtr in rtr_L + dst_L]))
+    for i, router in enumerate(router_L):
+        cost_A[i] = router.infinity
+        for dst, rtr_D in router.rt_tbl_D.items():
+            cost_A[i, dst_idx_D[dst]] = rtr_D.get(router.name, router.infinity)
+        for dst, nbr in router.next_hop_D.items():
+            if dst in dst_idx_D:
+                next_hop_A[i, dst_idx_D[dst]] = nbr or '' #None for unreachable destinations
+    numpy.savez(path_S, routers=numpy.array(rtr_L), destinations=numpy.array(dst_L), cost=cost_A, next_hop=next_hop_A)
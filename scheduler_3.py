@@ -0,0 +1,152 @@
+import queue
+import random
+import threading
+
+
+## Runs a simulation in a single thread instead of one thread per object.
+# Every tick it takes a few steps of each host, router and link in an order
+# shuffled by a seeded random generator, then advances the timer wheel.
+# Time is virtual (ticks of the wheel), routers draw their timer jitter from
+# generators seeded from the same seed, so runs with the same seed are identical.
+class DeterministicScheduler:
+
+    ## @param seed - seed of the step order and of all random choices
+    # @param tick_time - seconds of virtual time per tick, taken from the timer wheel if one is attached
+    # @param steps_per_tick - rounds of steps of every object per tick
+    def __init__(self, seed=0, tick_time=0.01, steps_per_tick=10):
+        self.rng = random.Random(seed)
+        self.tick_time = tick_time
+        self.steps_per_tick = steps_per_tick
+        self.step_L = [] #functions taking one step of a host, router or link
+        self.wheel = None
+        self.tick = 0
+        self.stop = False
+
+    ## called when printing the object
+    def __str__(self):
+        return 'DeterministicScheduler'
+
+    ## current virtual time in seconds
+    def now(self):
+        return self.tick * self.tick_time
+
+    ## take over stepping the given objects. Objects with a clock or sleep
+    # attribute are switched to virtual time, routers get seeded jitter.
+    # Attach routers before starting their timers so the first jitter is seeded too.
+    # @param obj_L: simulation objects, as in the simulation's object list
+    def attach(self, obj_L):
+        for obj in obj_L:
+            if hasattr(obj, 'clock'):
+                obj.clock = self.now
+            if hasattr(obj, 'sleep'):
+                obj.sleep = self.run_for
+            if hasattr(obj, 'forward_packet'):
+                obj.rng = random.Random(self.rng.getrandbits(64))
+                self.step_L.append(obj.step)
+            elif hasattr(obj, 'udt_receive'):
+                self.step_L.append(obj.step)
+            elif hasattr(obj, 'link_L'):
+                self.step_L.extend(link.step for link in obj.link_L)
+                if obj.socket_link_count:
+                    self.step_L.append(obj.receive) #one select over all sockets rather than a recv on each
+            elif hasattr(obj, 'advance'):
+                self.wheel = obj
+                self.tick_time = obj.tick_time
+
+    ## run one tick
+    def step(self):
+        for _ in range(self.steps_per_tick):
+            self.rng.shuffle(self.step_L)
+            for step in self.step_L:
+                step()
+        self.tick += 1
+        if self.wheel is not None:
+            self.wheel.advance()
+
+    ## run for a span of virtual time
+    # @param seconds: virtual seconds to run
+    def run_for(self, seconds):
+        for _ in range(int(round(seconds / self.tick_time))):
+            self.step()
+
+
+## Runs the step() of hosts, routers and links on a fixed pool of worker
+# threads instead of one busy thread per object. A node or link is put on
+# the ready queue when a packet is put into a queue it takes packets from,
+# and stays on it while its steps find work, so idle nodes cost nothing and
+# the number of threads does not depend on the size of the topology.
+class WorkerPoolScheduler:
+
+    def __init__(self):
+        self.ready_Q = queue.Queue() #nodes and links waiting for a worker
+        self.queued_S = set()        #nodes and links on the ready queue
+        self.running_S = set()       #nodes and links being stepped by a worker
+        self.dirty_S = set()         #running nodes and links that got a packet meanwhile
+        self.lock = threading.Lock()
+        self.stop = False #for thread termination
+
+    ## called when printing the object
+    def __str__(self):
+        return 'WorkerPoolScheduler'
+
+    ## put a node or link on the ready queue, unless it is already there or being stepped
+    def wake(self, obj):
+        with self.lock:
+            if obj in self.running_S:
+                self.dirty_S.add(obj)
+                return
+            if obj in self.queued_S:
+                return
+            self.queued_S.add(obj)
+        self.ready_Q.put(obj)
+
+    ## take over stepping the hosts, routers and links of the given objects
+    # @param obj_L: simulation objects, as in the simulation's object list
+    # @return the objects the scheduler does not step, which still need threads of their own
+    def attach(self, obj_L):
+        other_L = []
+        for obj in obj_L:
+            if hasattr(obj, 'step'):
+                #hosts and routers take the packets put into their in queues
+                for intf in obj.intf_L:
+                    intf.in_queue.notify = lambda obj=obj: self.wake(obj)
+                if hasattr(obj, 'post'):
+                    #and routers also the work their timers and link events post to the control plane
+                    obj.notify = lambda obj=obj: self.wake(obj)
+                self.wake(obj)
+            elif hasattr(obj, 'link_L'):
+                #links take the packets put into the out queues of their endpoints
+                for link in obj.link_L:
+                    for (node, intf) in link.endpoints():
+                        node.intf_L[intf].out_queue.notify = lambda link=link: self.wake(link)
+                    self.wake(link)
+                if obj.socket_link_count:
+                    #datagrams arriving from outside wake nothing, a thread of the
+                    # link layer waits for them and puts them into the in queues
+                    obj.receive_only = True
+                    other_L.append(obj)
+            else:
+                other_L.append(obj)
+        return other_L
+
+    ## thread target for each worker, steps ready nodes and links until stopped
+    def run(self):
+        print (threading.currentThread().getName() + ': Starting')
+        while not self.stop:
+            try:
+                obj = self.ready_Q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            with self.lock:
+                self.queued_S.discard(obj)
+                self.running_S.add(obj)
+            count = obj.step()
+            with self.lock:
+                self.running_S.discard(obj)
+                again = count or obj in self.dirty_S
+                self.dirty_S.discard(obj)
+                if again:
+                    self.queued_S.add(obj)
+            if again:
+                self.ready_Q.put(obj)
+        print (threading.currentThread().getName() + ': Ending')
@@ -1,88 +1,278 @@
 import network_3
 import link_3
+import profiling_3
+import trace_3
+import capture_3
+import metrics_3
+import replay_3
+import scheduler_3
+import routes_3
+import loadtest_3
 import threading
 from time import sleep
 import sys
 
 ##configuration parameters
 router_queue_size = 0 #0 means unlimited
+router_queue_bytes = 65536 #byte budget of each router interface queue, 0 means unlimited
+router_buffer_size = 262144 #bytes of the buffer shared by the queues of a router, 0 for none
+router_buffer_reserve = 8192 #bytes of the shared buffer guaranteed to each queue
+drop_policy = 'tail' #'tail' drops arriving packets on overflow, 'head' the oldest queued ones
+forwarding_workers = 1 #data plane threads in each router, 0 to run data and control plane on one thread
 simulation_time = 6   #give the network sufficient time to execute transfers
+infinity = 16 #route cost treated as unreachable
+split_horizon = True #do not advertise routes back to the neighbor they were learned from
+poisoned_reverse = True #advertise them back with cost infinity instead
+routing_mode = 'dv' #'dv' for distance vector, 'ls' for link state
+equal_cost_paths = False #all links between routers cost 1 and hosts H4 to H7 join RA, so flows to H2 are split over RB and RC
+update_interval = 2 #seconds between periodic route advertisements
+route_timeout = 7 #seconds after which a route that is not advertised again expires
+gc_time = 4 #seconds an expired route is kept before it is removed
+mcast_group = '224.0.0.1' #multicast group joined by all hosts
+mcast_core_D = {mcast_group: 'RA'} #core router of each group's shared tree
+profile_hooks = False #time the router, host and link loops
+profile_sampling = False #sample thread stacks into a flame graph file
+profile_collapsed_file = 'simulation_3.collapsed' #output of the sampling profiler
+trace_packets = False #timestamp data packets at every hop
+trace_file = 'simulation_3.trace' #output of the packet tracer, read with trace_3.py
+capture_file = None #write the packets delivered by all links to this pcapng file
+capture_prot = None #protocols to capture, e.g. '1' for data only, None for all
+capture_dst = None #destinations to capture, e.g. ['H2', '10.0.2.2'], None for all
+metrics_port = None #serve Prometheus metrics on http://127.0.0.1:<port>/metrics while the simulation runs
+record_file = None #record host sends and link events to this file
+replay_file = None #replay the events recorded in this file instead of the scenario below
+replay_speed = 1.0 #1 for the recorded pace, 2 for twice as fast, 0 for as fast as possible
+load_test_matrix = None #'all-to-all', 'hotspot' or 'gravity' runs a load test instead of the scenario below
+load_test_rates = None #offered loads in packets/s to step through, None to search for the saturation knee
+load_test_step_time = 2 #seconds of traffic at each offered load
+deterministic_seed = None #run in a single thread in an order and with jitter drawn from this seed
+worker_threads = 0 #run hosts, routers and links on a pool of this many threads, 0 for a thread each
+routes_export_file = None #write the final routing tables of all routers to this .csv or .npz file
 
 if __name__ == '__main__':
     object_L = [] #keeps track of objects, so we can kill their threads at the end
     
     #create network hosts
-    host_1 = network_3.Host('H1')
+    host_1 = network_3.Host('H1', ip_addr='10.0.1.2')
     object_L.append(host_1)
-    host_2 = network_3.Host('H2')
+    host_2 = network_3.Host('H2', ip_addr='10.0.2.2')
     object_L.append(host_2)
+    host_3 = network_3.Host('H3', ip_addr='10.0.3.2')
+    object_L.append(host_3)
+    #more hosts behind RA, whose flows to H2 are spread over the equal cost paths
+    extra_host_L = [network_3.Host('H%d' % k, ip_addr='10.0.%d.2' % k) for k in range(4, 8)] if equal_cost_paths else []
+    object_L.extend(extra_host_L)
     
     #create routers and cost tables for reaching neighbors
-    cost_D = {'H1': {0: 1}, 'RB': {1: 2}, 'RC': {2: 3}} # {neighbor: {interface: cost}}
+    cost_D = {'H1': {0: 1}, 'RB': {1: 1}, 'RC': {2: 1 if equal_cost_paths else 3}} # {neighbor: {interface: cost}}
+    addr_D = {0: '10.0.1.1/24', 1: '10.1.0.1/30', 2: '10.1.0.5/30'} # {interface: address/prefix length}
+    for k, host in enumerate(extra_host_L):
+        cost_D[str(host)] = {3 + k: 1}
+        addr_D[3 + k] = '10.0.%d.1/24' % (4 + k)
     router_a = network_3.Router(name='RA', 
                               cost_D = cost_D,
-                              max_queue_size=router_queue_size)
+                              addr_D = addr_D,
+                              max_queue_size=router_queue_size,
+                              max_queue_bytes=router_queue_bytes,
+                              buffer_size=router_buffer_size,
+                              buffer_reserve=router_buffer_reserve,
+                              drop_policy=drop_policy,
+                              forwarding_workers=forwarding_workers,
+                              infinity=infinity,
+                              split_horizon=split_horizon,
+                              poisoned_reverse=poisoned_reverse,
+                              mode=routing_mode,
+                              mcast_core_D=mcast_core_D)
     object_L.append(router_a)
 
-    cost_D = {'RD': {1: 3}, 'RA': {0: 2}} # {neighbor: {interface: cost}}
+    cost_D = {'RD': {1: 1}, 'RA': {0: 1 if equal_cost_paths else 3}} # {neighbor: {interface: cost}}
+    addr_D = {0: '10.1.0.2/30', 1: '10.1.0.9/30'} # {interface: address/prefix length}
     router_b = network_3.Router(name='RB', 
                               cost_D = cost_D,
-                              max_queue_size=router_queue_size)
+                              addr_D = addr_D,
+                              max_queue_size=router_queue_size,
+                              max_queue_bytes=router_queue_bytes,
+                              buffer_size=router_buffer_size,
+                              buffer_reserve=router_buffer_reserve,
+                              drop_policy=drop_policy,
+                              forwarding_workers=forwarding_workers,
+                              infinity=infinity,
+                              split_horizon=split_horizon,
+                              poisoned_reverse=poisoned_reverse,
+                              mode=routing_mode,
+                              mcast_core_D=mcast_core_D)
     object_L.append(router_b)
 
-    cost_D = {'RA': {0: 3}, 'RD': {1: 2}} # {neighbor: {interface: cost}}
+    cost_D = {'RA': {0: 1}, 'RD': {1: 1 if equal_cost_paths else 3}, 'H3': {2: 1}} # {neighbor: {interface: cost}}
+    addr_D = {0: '10.1.0.6/30', 1: '10.1.0.13/30', 2: '10.0.3.1/24'} # {interface: address/prefix length}
     router_c = network_3.Router(name='RC', 
                               cost_D = cost_D,
-                              max_queue_size=router_queue_size)
+                              addr_D = addr_D,
+                              max_queue_size=router_queue_size,
+                              max_queue_bytes=router_queue_bytes,
+                              buffer_size=router_buffer_size,
+                              buffer_reserve=router_buffer_reserve,
+                              drop_policy=drop_policy,
+                              forwarding_workers=forwarding_workers,
+                              infinity=infinity,
+                              split_horizon=split_horizon,
+                              poisoned_reverse=poisoned_reverse,
+                              mode=routing_mode,
+                              mcast_core_D=mcast_core_D)
     object_L.append(router_c)
 
-    cost_D = {'RB': {0: 3}, 'RC': {1: 2}, 'H2': {2: 1}} # {neighbor: {interface: cost}}
+    cost_D = {'RB': {0: 1 if equal_cost_paths else 3}, 'RC': {1: 1}, 'H2': {2: 1}} # {neighbor: {interface: cost}}
+    addr_D = {0: '10.1.0.10/30', 1: '10.1.0.14/30', 2: '10.0.2.1/24'} # {interface: address/prefix length}
     router_d = network_3.Router(name='RD', 
                               cost_D = cost_D,
-                              max_queue_size=router_queue_size)
+                              addr_D = addr_D,
+                              max_queue_size=router_queue_size,
+                              max_queue_bytes=router_queue_bytes,
+                              buffer_size=router_buffer_size,
+                              buffer_reserve=router_buffer_reserve,
+                              drop_policy=drop_policy,
+                              forwarding_workers=forwarding_workers,
+                              infinity=infinity,
+                              split_horizon=split_horizon,
+                              poisoned_reverse=poisoned_reverse,
+                              mode=routing_mode,
+                              mcast_core_D=mcast_core_D)
     object_L.append(router_d)
     
+    #start protocol timers on a timer wheel shared by all routers
+    timer_wheel = network_3.TimerWheel()
+    object_L.append(timer_wheel)
+    if deterministic_seed is not None:
+        scheduler = scheduler_3.DeterministicScheduler(deterministic_seed)
+        scheduler.attach(object_L)
+    for router in [router_a, router_b, router_c, router_d]:
+        router.start_timers(timer_wheel, update_interval=update_interval,
+                            route_timeout=route_timeout, gc_time=gc_time)
+    
     #create a Link Layer to keep track of links between network nodes
     link_layer = link_3.LinkLayer()
     object_L.append(link_layer)
     
     #add all the links - need to reflect the connectivity in cost_D tables above
     link_layer.add_link(link_3.Link(host_1, 0, router_a, 0))
-    link_layer.add_link(link_3.Link(router_a, 1, router_b, 0))
+    link_a_b = link_3.Link(router_a, 1, router_b, 0)
+    link_layer.add_link(link_a_b)
     link_layer.add_link(link_3.Link(router_a, 2, router_c, 0))
     link_layer.add_link(link_3.Link(router_b, 1, router_d, 0))
     link_layer.add_link(link_3.Link(router_c, 1, router_d, 1))
     link_layer.add_link(link_3.Link(router_d, 2, host_2, 0))
+    link_layer.add_link(link_3.Link(router_c, 2, host_3, 0))
+    for k, host in enumerate(extra_host_L):
+        link_layer.add_link(link_3.Link(router_a, 3 + k, host, 0))
 
 ##    link_layer.add_link(link_3.Link(host_2, 0, router_b, 1))
 ##    link_layer.add_link(link_3.Link(router_b, 0, router_a, 1))
 ##    link_layer.add_link(link_3.Link(router_a, 0, host_1, 0))
     
     
-    #start all the objects
+    #optional profiling
+    if profile_hooks:
+        hook_profiler = profiling_3.HookProfiler()
+        hook_profiler.attach(object_L)
+    if profile_sampling:
+        sampling_profiler = profiling_3.SamplingProfiler()
+        object_L.append(sampling_profiler)
+    if trace_packets:
+        packet_tracer = trace_3.PacketTracer(trace_file)
+        packet_tracer.attach(object_L)
+    if capture_file:
+        packet_capture = capture_3.PacketCapture(capture_file, capture_prot, capture_dst)
+        for link in link_layer.link_L:
+            packet_capture.attach_link(link)
+        object_L.append(packet_capture)
+    
+    #start all the objects, or let the scheduler step them in deterministic mode
     thread_L = []
-    for obj in object_L:
-        thread_L.append(threading.Thread(name=obj.__str__(), target=obj.run)) 
+    if deterministic_seed is not None:
+        scheduler.attach([link_layer])
+        sleep = scheduler.run_for
+    elif worker_threads:
+        scheduler = scheduler_3.WorkerPoolScheduler()
+        for obj in scheduler.attach(object_L):
+            thread_L.append(threading.Thread(name=obj.__str__(), target=obj.run))
+        for k in range(worker_threads):
+            thread_L.append(threading.Thread(name='Worker %d' % k, target=scheduler.run))
+        object_L.append(scheduler)
+    else:
+        for obj in object_L:
+            thread_L.append(threading.Thread(name=obj.__str__(), target=obj.run)) 
+    if metrics_port:
+        #served from its own thread in every mode, scrapes only read counters
+        metrics_server = metrics_3.MetricsServer(object_L, metrics_port)
+        object_L.append(metrics_server)
+        thread_L.append(threading.Thread(name=metrics_server.__str__(), target=metrics_server.run))
     
     for t in thread_L:
         t.start()
     
     ## compute routing tables
-    router_a.send_routes(1) #one update starts the routing process
+    router_a.post(router_a.send_routes, 1) #one update starts the routing process
     sleep(simulation_time)  #let the tables converge
     print("Converged routing tables")
-    for obj in object_L:
-        if str(type(obj)) == "<class 'network_3.Router'>":
-            obj.print_routes()
+    print(routes_3.format_all_routes([router_a, router_b, router_c, router_d]))
 
-    #send packet from host 1 to host 2
-    host_1.udt_send('H2', 'MESSAGE_FROM_H1')
-    sleep(simulation_time)
-    print("Sending response to h1")
+    if record_file:
+        event_recorder = replay_3.EventRecorder(record_file)
+        if deterministic_seed is not None:
+            scheduler.attach([event_recorder])
+        event_recorder.attach(object_L)
+    if replay_file:
+        event_replayer = replay_3.EventReplayer(replay_file, object_L, replay_speed)
+        if deterministic_seed is not None:
+            scheduler.attach([event_replayer])
+        event_replayer.replay()
+        sleep(simulation_time)
+    elif load_test_matrix:
+        load_test = loadtest_3.LoadTest(loadtest_3.matrix_D[load_test_matrix]([host_1, host_2, host_3] + extra_host_L))
+        if deterministic_seed is not None:
+            scheduler.attach([load_test])
+        if load_test_rates:
+            step_L = load_test.run(load_test_rates, load_test_step_time)
+        else:
+            step_L = load_test.find_knee(duration=load_test_step_time)
+        load_test.close()
+        print(load_test.report(step_L))
+    else:
+        #send packet from host 1 to host 2
+        host_1.udt_send('H2', 'MESSAGE_FROM_H1')
+        sleep(simulation_time)
+        print("Sending response to h1")
 
-    host_2.udt_send('H1', 'RESPONSE_FROM_H2')
-    sleep(simulation_time)
+        host_2.udt_send('H1', 'RESPONSE_FROM_H2')
+        sleep(simulation_time)
+    
+        #fail the RA-RB link and let routing recover through RC
+        router_L = [router_a, router_b, router_c, router_d]
+        link_layer.fail_link(link_a_b)
+        link_layer.measure_reconvergence(router_L)
+        host_1.udt_send(host_2.ip_addr, 'MESSAGE_AFTER_FAILURE')
+        sleep(simulation_time)
     
+        link_layer.restore_link(link_a_b)
+        link_layer.measure_reconvergence(router_L)
+    
+        #send one packet to a multicast group of all three hosts
+        for host in [host_1, host_2, host_3]:
+            host.join(mcast_group)
+        sleep(simulation_time)
+        host_1.udt_send(mcast_group, 'MULTICAST_FROM_H1')
+        sleep(simulation_time)
+        
+        if equal_cost_paths:
+            #one flow from each host behind RA to H2, the flows are split over RB and RC
+            count_L = [router_b.forwarded_count(), router_c.forwarded_count()]
+            for host in [host_1] + extra_host_L:
+                host.udt_send('H2', 'FLOW_FROM_%s' % host)
+            sleep(simulation_time)
+            print('Flows from RA to H2: %d packets forwarded by RB, %d by RC' % \
+                (router_b.forwarded_count() - count_L[0], router_c.forwarded_count() - count_L[1]))
+    if record_file:
+        event_recorder.close()
     
     #join all threads
     for o in object_L:
@@ -91,3 +281,24 @@ if __name__ == '__main__':
         t.join()
         
     print("All simulation threads joined")
+    for router in [router_a, router_b, router_c, router_d]:
+        print(router.format_queues())
+    
+    if profile_hooks:
+        print(hook_profiler.report())
+    if profile_sampling:
+        sampling_profiler.write_collapsed(profile_collapsed_file)
+        print('Wrote stack samples to %s' % profile_collapsed_file)
+    if trace_packets:
+        packet_tracer.close()
+        print(trace_3.analyze(trace_file))
+    if capture_file:
+        packet_capture.close()
+        print('Wrote captured packets to %s' % capture_file)
+    if routes_export_file:
+        router_L = [router_a, router_b, router_c, router_d]
+        if routes_export_file.endswith('.npz'):
+            routes_3.write_npz(router_L, routes_export_file)
+        else:
+            routes_3.write_csv(router_L, routes_export_file)
+        print('Wrote routing tables to %s' % routes_export_file)
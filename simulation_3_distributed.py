@@ -0,0 +1,101 @@
+import network_3
+import link_3
+import multiprocessing
+import threading
+from time import sleep
+import sys
+
+##configuration parameters
+router_queue_size = 0 #0 means unlimited
+simulation_time = 6   #give the network sufficient time to execute transfers
+infinity = 16 #route cost treated as unreachable
+update_interval = 2 #seconds between periodic route advertisements
+route_timeout = 7 #seconds after which a route that is not advertised again expires
+gc_time = 4 #seconds an expired route is kept before it is removed
+base_port = 47000 #UDP ports of the links between the processes start here
+
+## the topology of simulation_3.py split over two processes, A runs H1, RA, RC
+# and H3, B runs RB, RD and H2. The links RA-RB and RC-RD cross between them.
+router_D = { # {name: (partition, cost_D, addr_D)}
+    'RA': ('A', {'H1': {0: 1}, 'RB': {1: 1}, 'RC': {2: 3}}, {0: '10.0.1.1/24', 1: '10.1.0.1/30', 2: '10.1.0.5/30'}),
+    'RB': ('B', {'RD': {1: 1}, 'RA': {0: 3}}, {0: '10.1.0.2/30', 1: '10.1.0.9/30'}),
+    'RC': ('A', {'RA': {0: 1}, 'RD': {1: 3}, 'H3': {2: 1}}, {0: '10.1.0.6/30', 1: '10.1.0.13/30', 2: '10.0.3.1/24'}),
+    'RD': ('B', {'RB': {0: 3}, 'RC': {1: 1}, 'H2': {2: 1}}, {0: '10.1.0.10/30', 1: '10.1.0.14/30', 2: '10.0.2.1/24'}),
+}
+host_D = {'H1': ('A', '10.0.1.2'), 'H2': ('B', '10.0.2.2'), 'H3': ('A', '10.0.3.2')} # {name: (partition, address)}
+link_L = [('H1', 0, 'RA', 0), ('RA', 1, 'RB', 0), ('RA', 2, 'RC', 0), ('RB', 1, 'RD', 0),
+          ('RC', 1, 'RD', 1), ('RD', 2, 'H2', 0), ('RC', 2, 'H3', 0)]
+
+
+## build and run the nodes of one partition, links to the other partition go over UDP
+# @param partition: 'A' or 'B'
+def run_partition(partition):
+    object_L = [] #keeps track of objects, so we can kill their threads at the end
+    node_D = {}
+    for name, (part, ip_addr) in host_D.items():
+        if part == partition:
+            node_D[name] = network_3.Host(name, ip_addr=ip_addr)
+            object_L.append(node_D[name])
+    timer_wheel = network_3.TimerWheel()
+    for name, (part, cost_D, addr_D) in router_D.items():
+        if part == partition:
+            node_D[name] = network_3.Router(name=name, cost_D=cost_D, addr_D=addr_D,
+                                            max_queue_size=router_queue_size, infinity=infinity,
+                                            split_horizon=True, poisoned_reverse=True)
+            node_D[name].start_timers(timer_wheel, update_interval=update_interval,
+                                      route_timeout=route_timeout, gc_time=gc_time)
+            object_L.append(node_D[name])
+    object_L.append(timer_wheel)
+
+    link_layer = link_3.LinkLayer()
+    object_L.append(link_layer)
+    for k, (node_1, intf_1, node_2, intf_2) in enumerate(link_L):
+        addr_1, addr_2 = ('127.0.0.1', base_port + 2 * k), ('127.0.0.1', base_port + 2 * k + 1)
+        if node_1 in node_D and node_2 in node_D:
+            link_layer.add_link(link_3.Link(node_D[node_1], intf_1, node_D[node_2], intf_2))
+        elif node_1 in node_D:
+            link_layer.add_link(link_3.SocketLink(node_D[node_1], intf_1, addr_1, addr_2))
+        elif node_2 in node_D:
+            link_layer.add_link(link_3.SocketLink(node_D[node_2], intf_2, addr_2, addr_1))
+
+    thread_L = []
+    for obj in object_L:
+        thread_L.append(threading.Thread(name=obj.__str__(), target=obj.run))
+    for t in thread_L:
+        t.start()
+
+    #let both processes come up before routing starts
+    sleep(1)
+    if partition == 'A':
+        node_D['RA'].post(node_D['RA'].send_routes, 1) #one update starts the routing process
+    sleep(simulation_time)
+    if partition == 'A':
+        print("Converged routing tables")
+        print(node_D['RA'].format_routes())
+        node_D['H1'].udt_send('H2', 'MESSAGE_FROM_H1')
+    sleep(simulation_time)
+    if partition == 'B':
+        node_D['H2'].udt_send(host_D['H1'][1], 'RESPONSE_FROM_H2')
+    sleep(simulation_time)
+
+    #join all threads
+    for o in object_L:
+        o.stop = True
+    for t in thread_L:
+        t.join()
+    for link in link_layer.link_L:
+        if hasattr(link, 'close'):
+            link.close()
+    print("Partition %s: all simulation threads joined" % partition)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        #run one partition, e.g. on another machine with the addresses above changed
+        run_partition(sys.argv[1])
+    else:
+        process_L = [multiprocessing.Process(target=run_partition, args=(partition,)) for partition in ['A', 'B']]
+        for process in process_L:
+            process.start()
+        for process in process_L:
+            process.join()
@@ -0,0 +1,169 @@
+import itertools
+import struct
+import sys
+import time
+
+import network_3
+
+## trace events, recorded by the interface queue the packet passes through
+ENQ_OUT = 0 #node queued the packet for transmission
+DEQ_OUT = 1 #link took the packet for transmission
+ENQ_IN = 2  #link delivered the packet to the next node
+DEQ_IN = 3  #node took the packet for processing
+
+## trace file layout: magic, node count, length prefixed node names, then fixed size records
+magic_B = b'PTR1'
+## record: timestamp ns, packet id, node index, interface, event
+record_struct = struct.Struct('<QIHBB')
+
+
+## Records per-hop timestamps of data packets. attach() wraps the put/get
+# methods of the interfaces of the given nodes, so untraced runs pay nothing.
+# Hosts tag the data packets they send with a packet id (protocol '3') and
+# strip it again on receipt, routers forward traced packets like data.
+class PacketTracer:
+
+    ## @param path_S - trace file written by close()
+    def __init__(self, path_S):
+        self.path_S = path_S
+        self.name_L = [] #node index -> node name
+        self.buf = bytearray()
+        self.id_iter = itertools.count(1)
+        self.wrapped_L = [] #interfaces to restore on close
+
+    ## trace the interfaces of routers and hosts
+    # @param obj_L: simulation objects, those without interfaces are skipped
+    def attach(self, obj_L):
+        for obj in obj_L:
+            if not hasattr(obj, 'intf_L'):
+                continue
+            node_idx = len(self.name_L)
+            self.name_L.append(str(obj))
+            is_host = hasattr(obj, 'udt_send')
+            for i, intf in enumerate(obj.intf_L):
+                self.wrap_interface(intf, node_idx, i, is_host)
+
+    ## replace the put and get methods of one interface with tracing wrappers
+    def wrap_interface(self, intf, node_idx, i, is_host):
+        put, get = intf.put, intf.get
+        prot_pos = network_3.NetworkPacket.dst_S_length
+        id_end = prot_pos + 1 + network_3.NetworkPacket.trace_id_S_length
+        pack, buf, clock, id_iter = record_struct.pack, self.buf, time.monotonic_ns, self.id_iter
+        def traced_put(pkt_S, in_or_out, block=False):
+            if is_host and in_or_out == 'out' and pkt_S[prot_pos] == '1':
+                pkt_S = '%s3%08x%s' % (pkt_S[:prot_pos], next(id_iter) & 0xFFFFFFFF, pkt_S[prot_pos + 1:])
+            put(pkt_S, in_or_out, block)
+            if pkt_S[prot_pos] == '3':
+                buf.extend(pack(clock(), int(pkt_S[prot_pos + 1 : id_end], 16), node_idx, i,
+                                ENQ_OUT if in_or_out == 'out' else ENQ_IN))
+        def traced_get(in_or_out):
+            pkt_S = get(in_or_out)
+            if pkt_S is not None and pkt_S[prot_pos] == '3':
+                buf.extend(pack(clock(), int(pkt_S[prot_pos + 1 : id_end], 16), node_idx, i,
+                                DEQ_OUT if in_or_out == 'out' else DEQ_IN))
+                if is_host and in_or_out == 'in':
+                    pkt_S = pkt_S[:prot_pos] + '1' + pkt_S[id_end:]
+            return pkt_S
+        intf.put, intf.get = traced_put, traced_get
+        self.wrapped_L.append(intf)
+
+    ## stop tracing and write the trace file
+    def close(self):
+        for intf in self.wrapped_L:
+            del intf.put, intf.get
+        self.wrapped_L = []
+        with open(self.path_S, 'wb') as f:
+            f.write(magic_B)
+            f.write(struct.pack('<H', len(self.name_L)))
+            for name_S in self.name_L:
+                name_B = name_S.encode()
+                f.write(struct.pack('<B', len(name_B)) + name_B)
+            f.write(self.buf)
+
+
+## read a trace file
+# @param path_S: trace file written by PacketTracer
+# @return (node names, list of (ns, packet id, node index, interface, event))
+def read_trace(path_S):
+    with open(path_S, 'rb') as f:
+        data_B = f.read()
+    if data_B[:4] != magic_B:
+        raise Exception('%s: not a packet trace' % path_S)
+    (count,) = struct.unpack_from('<H', data_B, 4)
+    pos = 6
+    name_L = []
+    for _ in range(count):
+        length = data_B[pos]
+        name_L.append(data_B[pos + 1 : pos + 1 + length].decode())
+        pos += 1 + length
+    return name_L, list(record_struct.iter_unpack(data_B[pos:]))
+
+
+## value at a percentile of a sorted list
+def percentile(sorted_L, pct):
+    return sorted_L[min(len(sorted_L) - 1, int(len(sorted_L) * pct / 100))]
+
+
+## per-hop queueing delays, end-to-end latency percentiles and paths of a trace
+# @param path_S: trace file written by PacketTracer
+# @return the report as a string
+def analyze(path_S):
+    name_L, record_L = read_trace(path_S)
+    pkt_D = {} # {packet id: [records in time order]}
+    for record in sorted(record_L):
+        pkt_D.setdefault(record[1], []).append(record)
+    queue_D = {}   # {(node, interface, 'in'/'out'): [queueing delays in ns]}
+    latency_L = []
+    path_D = {}    # {path: packets}
+    for event_L in pkt_D.values():
+        enq_D = {}
+        for (t, _, node, intf, event) in event_L:
+            if event in (ENQ_OUT, ENQ_IN):
+                enq_D[(node, intf, event)] = t
+            else:
+                t_enq = enq_D.pop((node, intf, event - 1), None)
+                if t_enq is not None:
+                    key = (name_L[node], intf, 'out' if event == DEQ_OUT else 'in')
+                    queue_D.setdefault(key, []).append(t - t_enq)
+        #the link layer hands a packet over right after taking it off the sender's
+        #queue, so the node a copy arrives from is the last one to give it to a link
+        parent_D = {event_L[0][2]: None}
+        sender = None
+        for (_, _, node, _, event) in event_L:
+            if event == DEQ_OUT:
+                sender = node
+            elif event == ENQ_IN:
+                parent_D.setdefault(node, sender)
+        #a packet is delivered where it is taken in and not sent on again
+        forwarded_S = {node for (_, _, node, _, event) in event_L if event == ENQ_OUT}
+        for (t, _, node, _, event) in event_L:
+            if event == DEQ_IN and node not in forwarded_S:
+                latency_L.append(t - event_L[0][0])
+                path_L = [node]
+                while parent_D.get(path_L[-1]) is not None and len(path_L) <= len(name_L):
+                    path_L.append(parent_D[path_L[-1]])
+                path = tuple(name_L[hop] for hop in reversed(path_L))
+                path_D[path] = path_D.get(path, 0) + 1
+    line_L = ['%d packets traced' % len(pkt_D), '', 'Queueing delay per interface queue (us)']
+    line_L.append('%-10s %5s %4s %8s %10s %10s %10s' % ('node', 'intf', 'dir', 'packets', 'mean', 'p50', 'p99'))
+    for key in sorted(queue_D):
+        delay_L = sorted(queue_D[key])
+        line_L.append('%-10s %5d %4s %8d %10.1f %10.1f %10.1f' % (key + (len(delay_L), sum(delay_L) / len(delay_L) / 1e3,
+            percentile(delay_L, 50) / 1e3, percentile(delay_L, 99) / 1e3)))
+    line_L += ['', 'End-to-end latency (us)']
+    if latency_L:
+        latency_L.sort()
+        line_L.append('delivered %d  p50 %.1f  p90 %.1f  p99 %.1f  max %.1f' % (len(latency_L),
+            percentile(latency_L, 50) / 1e3, percentile(latency_L, 90) / 1e3,
+            percentile(latency_L, 99) / 1e3, latency_L[-1] / 1e3))
+    line_L += ['', 'Paths taken']
+    for path, count in sorted(path_D.items(), key=lambda item: -item[1]):
+        line_L.append('%6d  %s' % (count, ' -> '.join(path)))
+    return '\n'.join(line_L)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python trace_3.py <trace file>')
+        sys.exit(1)
+    print(analyze(sys.argv[1]))